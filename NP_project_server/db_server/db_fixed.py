@@ -1,153 +1,424 @@
 # db_server/db_server.py
 import argparse
+import asyncio
+import hashlib
+import hmac
 import json
-import socket
 import struct
 import threading
 import sys
 import os
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫
+    orjson = None
 
 MAX_LEN = 65536
+SNAPSHOT_INTERVAL = 30.0  # 秒；定期把整個 DB 寫成快照並清空 WAL
+SNAPSHOT_OPS = 1000  # WAL 累積這麼多筆也會提早寫快照
+DISPATCH_WORKERS = 16  # 執行 storage 操作的執行緒數
+_KEYS = {"players": "id", "developers": "id", "games": "name", "rooms": "id"}
+_HDR = struct.Struct("!I")  # 4-byte 長度前綴
+
+
+def _dumps(obj, indent=False):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None,
+                      separators=None if indent else (",", ":")).encode("utf-8")
+
+
+def _loads(data):
+    # orjson 直接吃 bytes，省掉 UTF-8 decode
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# 密碼只存 keyed BLAKE2b 雜湊 (前綴 "b2$")；PEPPER 不存在 DB 檔裡
+# (最長 64 bytes)。舊資料的明文密碼登入成功時會換成雜湊
+PEPPER = os.environ.get("NP_DB_PEPPER", "").encode("utf-8")[:64]
+_PW_PREFIX = "b2$"
+
+
+def _hash_password(password):
+    digest = hashlib.blake2b(str(password).encode("utf-8"), key=PEPPER,
+                             digest_size=32).hexdigest()
+    return _PW_PREFIX + digest
+
+
+def _check_password(stored, password, hashed):
+    # hashed 是 _hash_password(password)；一律用 compare_digest (常數時間)
+    stored = stored or ""
+    if stored.startswith(_PW_PREFIX):
+        return hmac.compare_digest(stored, hashed)
+    return hmac.compare_digest(stored.encode("utf-8"),
+                               str(password).encode("utf-8"))
+
 
+# 成功回應的外層固定不變：預先編好前綴，只編碼 data 再接起來
+_OK_PREFIX = b'{"status":"success","data":'
 
-def _readn(sock, n):
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Socket closed")
-        buf += chunk
-    return buf
 
+def _framed_ok(data):
+    # 回傳含長度 header 的完整封包
+    body = _dumps(data)
+    return b"".join((_HDR.pack(len(_OK_PREFIX) + len(body) + 1),
+                     _OK_PREFIX, body, b"}"))
 
-def send_message(sock, obj):
-    body = json.dumps(obj, ensure_ascii=False,
-                      separators=(",", ":")).encode("utf-8")
-    sock.sendall(struct.pack("!I", len(body)) + body)
 
+# 連線由 asyncio 事件迴圈處理 (單一執行緒)，不再每個連線開一條執行緒
+async def send_message(writer, obj):
+    body = _dumps(obj)
+    writer.write(_HDR.pack(len(body)) + body)
+    await writer.drain()
 
-def recv_message(sock):
-    header = _readn(sock, 4)
-    (n,) = struct.unpack("!I", header)
+
+async def recv_message(reader):
+    # 對方關線時 readexactly 丟 IncompleteReadError
+    (n,) = _HDR.unpack(await reader.readexactly(_HDR.size))
     if n > MAX_LEN:
         raise ValueError("Message too large")
-    body = _readn(sock, n)
-    return json.loads(body.decode("utf-8"))
+    return _loads(await reader.readexactly(n))
+
+
+class RWLock:
+    """讀寫鎖: 讀者可同時進入，寫者獨占 (有寫者等待時新讀者先排隊)"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
 
 
 class SimpleStorage:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pretty=False):
         self.db_path = db_path
-        self.lock = threading.Lock()
+        self.pretty = pretty  # 快照是否縮排 (只為了方便人工檢視)
+        self.wal_path = db_path + ".wal"
+        # 每個集合各一把讀寫鎖；需要多把時一律依 _locks 的順序取得，避免死結
+        self.players_lock = RWLock()  # players + developers
+        self.games_lock = RWLock()
+        self.rooms_lock = RWLock()
+        self.reviews_lock = RWLock()
+        self.history_lock = RWLock()
+        self._locks = (self.players_lock, self.games_lock, self.rooms_lock,
+                       self.reviews_lock, self.history_lock)
+        self._io_lock = threading.Lock()  # 保護 WAL 檔與 _seq / _ops
+        # 唯讀列表回應 (含長度 header) 的快取，資料修改時清掉
+        self._framed = {}
+        self._framed_ver = {}
+        self._framed_lock = threading.Lock()
         self.data = {
             "players": [], "developers": [], "rooms": [], "games": [], "reviews": [],
             "play_history": {},
             "nexts": {"player": 1, "developer": 1, "room": 1}
         }
+        self.wal = None
+        self._seq = 0  # 最後一筆 WAL 的序號 (快照裡也記一份)
+        self._ops = 0  # 上次快照之後寫了幾筆 WAL
+        self._stop = threading.Event()
+        self._kick = threading.Event()
         self.load()
+        self._build_index()
+        # 每次修改只 append 一行到 WAL，不再整個 DB 重寫
+        self.wal = open(self.wal_path, "ab")
+        self._snapshotter = threading.Thread(
+            target=self._snapshot_loop, daemon=True)
+        self._snapshotter.start()
 
     def load(self):
         if os.path.exists(self.db_path):
             try:
-                with open(self.db_path, "r", encoding="utf-8") as f:
-                    loaded = json.load(f)
+                with open(self.db_path, "rb") as f:
+                    loaded = _loads(f.read())
                     for k in self.data.keys():
                         if k in loaded:
                             self.data[k] = loaded[k]
+                    self._seq = int(loaded.get("wal_seq", 0))
                 if isinstance(self.data.get("play_history"), list):
                     self.data["play_history"] = {}
-                for p in self.data["players"]:
-                    p["online"] = False
                 print(f"[Storage] Loaded DB from {self.db_path}")
             except Exception as e:
                 print(f"[Storage] Load error: {e}, using empty DB")
         else:
             print("[Storage] No DB file found, starting new.")
+        # 沒有快照也要重播 WAL：否則舊紀錄留在檔案裡，seq 又從 1 開始，
+        # 下次啟動時會跟新紀錄交錯重播
+        self._replay_wal()
+        for p in self.data["players"]:
+            p["online"] = False
+        if not os.path.exists(self.db_path):
             self.save()
 
+    def _build_index(self):
+        # 以 id / username / name 建立索引，查詢不必線性掃描
+        # (reversed: 名稱重複時保留第一筆，與原本的掃描結果一致)
+        players = self.data["players"]
+        self._players_by_id = {p["id"]: p for p in reversed(players)}
+        self._players_by_username = {
+            p["username"]: p for p in reversed(players)}
+        self._devs_by_username = {
+            u["username"]: u for u in reversed(self.data["developers"])}
+        self._games_by_name = {
+            g["name"]: g for g in reversed(self.data["games"])}
+        self._rooms_by_id = {r["id"]: r for r in reversed(self.data["rooms"])}
+
+    def framed_response(self, key, build):
+        """回傳 {"status": "success", "data": build()} 編碼 + 長度 header 後的
+        bytes，直接 write 出去；key 對應的資料被修改前重複使用"""
+        framed = self._framed.get(key)
+        if framed is None:
+            ver = self._framed_ver.get(key, 0)
+            framed = _framed_ok(build())
+            # build() 期間若有寫入者清除過快取，這份結果可能已過期，不存
+            with self._framed_lock:
+                if self._framed_ver.get(key, 0) == ver:
+                    self._framed[key] = framed
+        return framed
+
+    def _invalidate(self, key):
+        with self._framed_lock:
+            self._framed.pop(key, None)
+            self._framed_ver[key] = self._framed_ver.get(key, 0) + 1
+
+    # --- WAL ---
+    def _replay_wal(self):
+        if not os.path.exists(self.wal_path):
+            return
+        n = 0
+        with open(self.wal_path, "rb") as f:
+            for line in f:
+                try:
+                    rec = _loads(line)
+                except ValueError:
+                    break  # 當機時寫到一半的最後一行
+                # 快照已包含的紀錄 (寫完快照、還沒清 WAL 就當機) 跳過
+                if rec["seq"] <= self._seq:
+                    continue
+                self._apply(rec)
+                self._seq = rec["seq"]
+                n += 1
+        if n:
+            print(f"[Storage] Replayed {n} WAL records")
+
+    def _apply(self, rec):
+        op = rec["op"]
+        if op == "set":  # nexts / play_history 裡的一個 key
+            self.data[rec["field"]][rec["key"]] = rec["value"]
+            return
+        coll = self.data[rec["coll"]]
+        key = _KEYS.get(rec["coll"])
+        if op == "del":
+            coll[:] = [x for x in coll if x[key] != rec["key"]]
+        elif key is None:  # reviews 只會新增
+            coll.append(rec["row"])
+        else:
+            row = rec["row"]
+            for i, x in enumerate(coll):
+                if x[key] == row[key]:
+                    coll[i] = row
+                    break
+            else:
+                coll.append(row)
+
+    def _append_wal(self, rec):
+        # 呼叫端持有對應集合的寫鎖；寫檔這一小段另外用 _io_lock 序列化
+        with self._io_lock:
+            self._seq += 1
+            rec["seq"] = self._seq
+            self.wal.write(_dumps(rec) + b"\n")
+            self.wal.flush()
+            self._ops += 1
+            if self._ops >= SNAPSHOT_OPS:
+                self._kick.set()
+
+    def _put(self, coll, row):
+        self._append_wal({"op": "put", "coll": coll, "row": row})
+
+    def _set(self, field, key, value):
+        self._append_wal(
+            {"op": "set", "field": field, "key": key, "value": value})
+
+    @contextmanager
+    def _read_all(self):
+        # 依固定順序取得所有讀鎖：沒有寫入進行中，拿到一致的快照
+        with ExitStack() as stack:
+            for lock in self._locks:
+                stack.enter_context(lock.read())
+            with self._io_lock:
+                yield
+
+    def _snapshot_loop(self):
+        while not self._stop.is_set():
+            self._kick.wait(SNAPSHOT_INTERVAL)
+            self._kick.clear()
+            with self._read_all():
+                if not self._ops:
+                    continue
+                snap = self._encode_snapshot()
+            # 寫檔 / fsync 在鎖外做：事件迴圈上的寫入請求不必等磁碟
+            self._write_snapshot(*snap)
+
+    def close(self):
+        self._stop.set()
+        self._kick.set()
+        self._snapshotter.join()
+        self.save()
+        self.wal.close()
+
     def record_play(self, user_ids, game_name):
-        with self.lock:
+        with self.players_lock.read(), self.history_lock.write():
             for uid in user_ids:
-                target = next(
-                    (p for p in self.data["players"] if p["id"] == uid), None)
+                target = self._players_by_id.get(uid)
                 if target:
                     uname = target["username"]
                     if uname not in self.data["play_history"]:
                         self.data["play_history"][uname] = []
                     if game_name not in self.data["play_history"][uname]:
                         self.data["play_history"][uname].append(game_name)
-            self.save()
+                        self._set("play_history", uname,
+                                  self.data["play_history"][uname])
             return {"status": "success"}
 
     def save(self):
-        with open(self.db_path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        with self._read_all():
+            snap = self._encode_snapshot()
+        self._write_snapshot(*snap)
+
+    def _encode_snapshot(self):
+        # 呼叫端透過 _read_all 持有所有鎖 (或還在初始化)：只在記憶體裡編碼，
+        # 並記下目前 WAL 的長度，之後寫入的紀錄不在這份快照裡
+        # 預設不縮排：快照只給程式讀，縮排版編碼較慢、檔案約大一倍
+        body = _dumps(dict(self.data, wal_seq=self._seq), indent=self.pretty)
+        offset = self.wal.tell() if self.wal is not None else None
+        self._ops = 0
+        return body, offset
+
+    def _write_snapshot(self, body, offset):
+        # 快照：整個 DB 寫到暫存檔再 os.replace；不持有集合的鎖
+        tmp = self.db_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.db_path)
+        if offset is None:
+            return
+        # 快照之後才寫進 WAL 的紀錄搬到新的 WAL，其餘丟掉；
+        # 中途當機時舊 WAL 還在，重播會跳過快照已包含的 seq
+        with self._io_lock:
+            with open(self.wal_path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+            tmp = self.wal_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(tail)
+            self.wal.close()
+            os.replace(tmp, self.wal_path)
+            self.wal = open(self.wal_path, "ab")
 
     def _get_collection(self, role):
         if role == "developer":
-            return self.data["developers"], "developer"
-        return self.data["players"], "player"
+            return self.data["developers"], "developer", self._devs_by_username
+        return self.data["players"], "player", self._players_by_username
 
     def register(self, username, password, role="player"):
-        with self.lock:
-            collection, kind = self._get_collection(role)
-            for u in collection:
-                if u["username"] == username:
-                    return {"status": "error", "message": "Account already exists"}
+        hashed = _hash_password(password)  # 在鎖外算雜湊
+        with self.players_lock.write():
+            collection, kind, by_name = self._get_collection(role)
+            if username in by_name:
+                return {"status": "error", "message": "Account already exists"}
             uid = self.data["nexts"][kind]
             self.data["nexts"][kind] += 1
             new_user = {
-                "id": uid, "username": username, "password": password,
+                "id": uid, "username": username, "password": hashed,
                 "token": None, "online": False, "created_at": time.time()
             }
             collection.append(new_user)
-            self.save()
+            by_name[username] = new_user
+            if kind == "player":
+                self._players_by_id[uid] = new_user
+            self._set("nexts", kind, self.data["nexts"][kind])
+            self._put(kind + "s", new_user)
             return {"status": "success", "data": {"id": uid, "username": username}}
 
     def login(self, username, password, role="player"):
-        with self.lock:
-            collection, _ = self._get_collection(role)
-            target = None
-            for u in collection:
-                if u["username"] == username:
-                    target = u
-                    break
+        hashed = _hash_password(password)
+        with self.players_lock.write():
+            _, kind, by_name = self._get_collection(role)
+            target = by_name.get(username)
             if not target:
                 return {"status": "error", "message": "Account does not exist"}
-            if target["password"] != password:
+            if not _check_password(target["password"], password, hashed):
                 return {"status": "error", "message": "Wrong password"}
+            target["password"] = hashed
             new_token = str(uuid.uuid4())
             target["token"] = new_token
             target["online"] = True
-            self.save()
+            self._put(kind + "s", target)
             return {"status": "success", "data": {"id": target["id"], "username": target["username"], "token": new_token}}
 
     def logout(self, username, role="player"):
-        with self.lock:
-            collection, _ = self._get_collection(role)
-            for u in collection:
-                if u["username"] == username:
-                    u["online"] = False
-                    self.save()
-                    return {"status": "success", "message": "Logged out"}
+        with self.players_lock.write():
+            _, kind, by_name = self._get_collection(role)
+            u = by_name.get(username)
+            if u:
+                u["online"] = False
+                self._put(kind + "s", u)
+                return {"status": "success", "message": "Logged out"}
             return {"status": "error", "message": "User not found"}
 
     def user_list_online(self):
-        return [{"id": u["id"], "username": u["username"]} for u in self.data["players"] if u.get("online")]
+        with self.players_lock.read():
+            return [{"id": u["id"], "username": u["username"]} for u in self.data["players"] if u.get("online")]
 
     def game_upsert(self, meta, file_path):
-        with self.lock:
+        with self.games_lock.write():
             name = meta.get("game_name")
-            target = next(
-                (g for g in self.data["games"] if g["name"] == name), None)
+            target = self._games_by_name.get(name)
             if target:
                 if target.get("author") != meta.get("author"):
                     return {"status": "error", "message": "Permission denied"}
             else:
                 target = {"name": name, "created_at": time.time()}
                 self.data["games"].append(target)
+                self._games_by_name[name] = target
             target.update({
                 "author": meta.get("author", "unknown"),
                 "version": meta.get("version"),
@@ -157,56 +428,60 @@ class SimpleStorage:
                 "min_players": meta.get("min_players", 2),
                 "max_players": meta.get("max_players", 2)
             })
-            self.save()
+            self._put("games", target)
+            self._invalidate("game_list")
             return {"status": "success", "data": target}
 
     def game_delete(self, name, author):
-        with self.lock:
-            target = next(
-                (g for g in self.data["games"] if g["name"] == name), None)
+        with self.games_lock.write():
+            target = self._games_by_name.get(name)
             if not target:
                 return {"status": "error", "message": "Game not found"}
             if target.get("author") != author:
                 return {"status": "error", "message": "Permission denied"}
             self.data["games"].remove(target)
-            self.save()
+            del self._games_by_name[name]
+            self._append_wal({"op": "del", "coll": "games", "key": name})
+            self._invalidate("game_list")
             return {"status": "success", "message": "Game deleted"}
 
     def game_list(self):
-        return [{"name": g["name"], "version": g["version"], "author": g.get("author"), "description": g.get("description")} for g in self.data["games"]]
+        with self.games_lock.read():
+            return [{"name": g["name"], "version": g["version"], "author": g.get("author"), "description": g.get("description")} for g in self.data["games"]]
 
     def game_get(self, name):
-        return next((g for g in self.data["games"] if g["name"] == name), None)
+        with self.games_lock.read():
+            return self._games_by_name.get(name)
 
     def review_add(self, game_name, username, rating, comment):
-        with self.lock:
-            if not any(g["name"] == game_name for g in self.data["games"]):
+        with self.games_lock.read(), self.reviews_lock.write(), \
+                self.history_lock.read():
+            if game_name not in self._games_by_name:
                 return {"status": "error", "message": "Game not found"}
             history = self.data["play_history"].get(username, [])
             if game_name not in history:
                 return {"status": "error", "message": "You must play this game before reviewing."}
             if not (1 <= rating <= 5):
                 return {"status": "error", "message": "Rating must be 1-5"}
-            self.data["reviews"].append({
+            review = {
                 "game_name": game_name, "username": username, "rating": rating,
                 "comment": comment[:200], "created_at": time.time()
-            })
-            self.save()
+            }
+            self.data["reviews"].append(review)
+            self._put("reviews", review)
             return {"status": "success", "message": "Review added"}
 
     def review_list(self, game_name):
-        return [r for r in self.data["reviews"] if r["game_name"] == game_name]
+        with self.reviews_lock.read():
+            return [r for r in self.data["reviews"] if r["game_name"] == game_name]
 
     def room_create(self, d):
-        with self.lock:
+        with self.players_lock.read(), self.rooms_lock.write():
             rid = self.data["nexts"]["room"]
             self.data["nexts"]["room"] += 1
             host_id = d.get("hostUserId") or d.get("user_id")
-            host_name = str(host_id)
-            for p in self.data["players"]:
-                if p["id"] == host_id:
-                    host_name = p["username"]
-                    break
+            host = self._players_by_id.get(host_id)
+            host_name = host["username"] if host else str(host_id)
 
             r = {
                 "id": rid,
@@ -219,121 +494,164 @@ class SimpleStorage:
                 "max_players": d.get("max_players", 2)
             }
             self.data["rooms"].append(r)
-            self.save()
+            self._rooms_by_id[rid] = r
+            self._set("nexts", "room", self.data["nexts"]["room"])
+            self._put("rooms", r)
+            self._invalidate("list_public")
             return r
 
     def room_list_public(self):
-        return self.data["rooms"]
+        with self.rooms_lock.read():
+            return list(self.data["rooms"])
 
     def _get_room(self, rid):
-        return next((r for r in self.data["rooms"] if r["id"] == rid), None)
+        return self._rooms_by_id.get(rid)
 
     def room_accept(self, d):
-        with self.lock:
+        with self.rooms_lock.write():
             rid = d.get("roomId") or d.get("room_id")
             uid = d.get("userId") or d.get("user_id")
             r = self._get_room(rid)
             if r:
                 if uid not in r["users"]:
                     r["users"].append(uid)
-                self.save()
+                    self._put("rooms", r)
+                    self._invalidate("list_public")
                 return r
             return None
 
     def room_leave(self, d):
-        with self.lock:
+        with self.rooms_lock.write():
             rid = d.get("roomId") or d.get("room_id")
             uid = d.get("userId") or d.get("user_id")
             r = self._get_room(rid)
             if r and uid in r["users"]:
                 r["users"].remove(uid)
-                self.save()
+                self._put("rooms", r)
+                self._invalidate("list_public")
                 return r
             return None
 
 
-def handle_client(conn, addr, storage):
+def _ok(out):
+    return _framed_ok(out)  # 完整封包，handle_client 直接寫出
+
+
+def _game_get(s, d):
+    out = s.game_get(d.get("name"))
+    return _ok(out) if out else {"status": "error", "message": "Not found"}
+
+
+# action -> fn(storage, data)；回傳 dict，或 framed_response 快取的完整封包 (bytes)
+ACTIONS = {
+    "record_play": lambda s, d: s.record_play(
+        d.get("user_ids"), d.get("game_name")),
+    "auth_register": lambda s, d: s.register(
+        d.get("username"), d.get("password"), d.get("role", "player")),
+    "auth_login": lambda s, d: s.login(
+        d.get("username"), d.get("password"), d.get("role", "player")),
+    "logout": lambda s, d: s.logout(
+        d.get("username"), d.get("role", "player")),
+    "game_upsert": lambda s, d: s.game_upsert(
+        d.get("meta"), d.get("file_path")),
+    "game_list": lambda s, d: s.framed_response("game_list", s.game_list),
+    "game_get": _game_get,
+    "game_delete": lambda s, d: s.game_delete(
+        d.get("game_name"), d.get("author")),
+    "review_add": lambda s, d: s.review_add(
+        d.get("game_name"), d.get("username"),
+        d.get("rating"), d.get("comment")),
+    "review_list": lambda s, d: _ok(s.review_list(d.get("game_name"))),
+    "create_room": lambda s, d: _ok(s.room_create(d)),
+    "list_public": lambda s, d: s.framed_response(
+        "list_public", s.room_list_public),
+    "accept": lambda s, d: _ok(s.room_accept(d)),
+    "leave": lambda s, d: _ok(s.room_leave(d)),
+    "list_online": lambda s, d: _ok(s.user_list_online()),
+}
+
+
+def dispatch(storage, req):
+    # 在 _dispatch_pool 的執行緒裡跑：storage 操作會等讀寫鎖 (例如快照
+    # 編碼期間) 並寫 WAL，不能卡住事件迴圈、拖住其他連線
+    act = req.get("action")
+    handler = ACTIONS.get(act)
+    if handler is None:
+        return {"status": "error", "message": f"Unknown action: {act}"}
+    return handler(storage, req.get("data") or {})
+
+
+_dispatch_pool = ThreadPoolExecutor(max_workers=DISPATCH_WORKERS,
+                                    thread_name_prefix="db")
+
+
+async def handle_client(reader, writer, storage):
+    loop = asyncio.get_running_loop()
     try:
-        req = recv_message(conn)
-        act = req.get("action")
-        data = req.get("data") or {}
-        resp = None
-
-        if act == "record_play":
-            resp = storage.record_play(
-                data.get("user_ids"), data.get("game_name"))
-        elif act == "auth_register":
-            resp = storage.register(data.get("username"), data.get(
-                "password"), data.get("role", "player"))
-        elif act == "auth_login":
-            resp = storage.login(data.get("username"), data.get(
-                "password"), data.get("role", "player"))
-        elif act == "logout":
-            resp = storage.logout(data.get("username"),
-                                  data.get("role", "player"))
-        elif act == "game_upsert":
-            resp = storage.game_upsert(data.get("meta"), data.get("file_path"))
-        elif act == "game_list":
-            resp = {"status": "success", "data": storage.game_list()}
-        elif act == "game_get":
-            out = storage.game_get(data.get("name"))
-            resp = {"status": "success", "data": out} if out else {
-                "status": "error", "message": "Not found"}
-        elif act == "game_delete":
-            resp = storage.game_delete(
-                data.get("game_name"), data.get("author"))
-        elif act == "review_add":
-            resp = storage.review_add(data.get("game_name"), data.get(
-                "username"), data.get("rating"), data.get("comment"))
-        elif act == "review_list":
-            resp = {"status": "success",
-                    "data": storage.review_list(data.get("game_name"))}
-        elif act == "create_room":
-            resp = {"status": "success", "data": storage.room_create(data)}
-        elif act == "list_public":
-            resp = {"status": "success", "data": storage.room_list_public()}
-        elif act == "accept":
-            resp = {"status": "success", "data": storage.room_accept(data)}
-        elif act == "leave":
-            resp = {"status": "success", "data": storage.room_leave(data)}
-        elif act == "list_online":
-            resp = {"status": "success", "data": storage.user_list_online()}
-
-        if resp is None:
-            resp = {"status": "error", "message": f"Unknown action: {act}"}
-        send_message(conn, resp)
+        # 同一條連線可連續送多個請求 (lobby 的連線池會重複使用)
+        while True:
+            req = await recv_message(reader)
+            resp = await loop.run_in_executor(
+                _dispatch_pool, dispatch, storage, req)
+            if isinstance(resp, bytes):  # 快取好的完整封包
+                writer.write(resp)
+                await writer.drain()
+            else:
+                await send_message(writer, resp)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass  # 對方關閉連線
     except Exception as e:
         print(f"[DB] Error: {e}")
         try:
-            send_message(conn, {"status": "error", "message": str(e)})
-        except:
+            await send_message(writer, {"status": "error", "message": str(e)})
+        except Exception:
             pass
     finally:
-        conn.close()
+        # 關機時 asyncio.run 取消連線，CancelledError 照常往上傳
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def serve(port, storage):
+    # 連線 task 自己管：關機時取消並等它們收尾
+    # (3.11 的 start_server 在 task 被取消時會印出多餘的 traceback)
+    tasks = set()
+
+    def on_connect(reader, writer):
+        t = asyncio.create_task(handle_client(reader, writer, storage))
+        tasks.add(t)
+        t.add_done_callback(tasks.discard)
+
+    srv = await asyncio.start_server(
+        on_connect, "0.0.0.0", port, reuse_address=True, backlog=128)
+    print(f"[DB] Listening on port {port}")
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=10001)
     parser.add_argument("--db", default="db_clean.json")
+    parser.add_argument("--pretty", action="store_true",
+                        help="write the DB snapshot with indentation")
     args = parser.parse_args()
-    storage = SimpleStorage(args.db)
-    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    srv.bind(("0.0.0.0", args.port))
-    srv.listen(5)
-    print(f"[DB] Listening on port {args.port}")
+    storage = SimpleStorage(args.db, pretty=args.pretty)
     try:
-        while True:
-            conn, addr = srv.accept()
-            t = threading.Thread(target=handle_client,
-                                 args=(conn, addr, storage))
-            t.daemon = True
-            t.start()
+        asyncio.run(serve(args.port, storage))
     except KeyboardInterrupt:
         pass
     finally:
-        srv.close()
+        _dispatch_pool.shutdown(wait=True)  # 進行中的操作做完才寫最後的快照
+        storage.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 # lobby_server/lobby_server.py
-from utils.protocol import send_message, recv_message, recv_file, send_file
+from utils.protocol import send_message, recv_message, recv_file_to_path, send_file_from_path
 import argparse
+import select
 import socket
 import threading
 import os
@@ -9,6 +10,7 @@ import subprocess
 import zipfile
 import random
 import time
+from collections import deque
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -84,19 +86,86 @@ _ONLINE_CLIENTS = {}
 _LOCK = threading.Lock()
 
 
-def call_db(dbhost, dbport, payload):
+# 池中連線最多閒置幾秒；要比 DB 的 IDLE_TIMEOUT 短，避免拿到 DB 正要關的連線
+POOL_IDLE = 3.0
+
+
+def _is_idle_alive(s):
+    # 閒置的連線上不該有資料可讀；可讀代表 DB 已關閉連線 (例如 DB 重開)，
+    # 在送出請求前就丟掉，不必等請求失敗再重送
     try:
-        s = socket.create_connection((dbhost, dbport), timeout=5)
-        send_message(s, payload)
-        resp = recv_message(s)
+        readable, _, _ = select.select([s], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+class DBPool:
+    """到 DB server 的持久連線池，省掉每個請求的連線建立/關閉"""
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size  # 每個 (host, port) 最多保留幾條閒置連線
+        self.idle = {}  # (host, port) -> deque[(socket, 放回池中的時間)]
+        self.lock = threading.Lock()
+
+    def acquire(self, host, port):
+        """回傳 (socket, 是否為重複使用的連線)"""
+        while True:
+            with self.lock:
+                q = self.idle.get((host, port))
+                s, since = q.pop() if q else (None, 0)
+            if s is None:
+                break
+            # 閒置太久的連線 DB 隨時會關掉，不拿來送請求
+            if time.monotonic() - since < POOL_IDLE and _is_idle_alive(s):
+                return s, True
+            s.close()
+        s = socket.create_connection((host, port), timeout=5)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return s, False
+
+    def release(self, host, port, s):
+        with self.lock:
+            q = self.idle.setdefault((host, port), deque())
+            if len(q) < self.max_size:
+                q.append((s, time.monotonic()))
+                return
         s.close()
+
+
+_db_pool = DBPool()
+
+
+# 重送不會改變 DB 內容的請求
+_READ_ONLY = frozenset(("game_get", "game_list", "list_public", "list_online",
+                        "review_list"))
+
+
+def call_db(dbhost, dbport, payload):
+    read_only = payload.get("action") in _READ_ONLY
+    for attempt in range(2):
+        try:
+            s, reused = _db_pool.acquire(dbhost, dbport)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        try:
+            send_message(s, payload)
+            resp = recv_message(s)
+        except Exception as e:
+            s.close()
+            # 舊連線在檢查之後才斷掉時換一條新的重試一次；寫入類的請求
+            # DB 可能已經執行過 (例如斷在 recv)，不能重送
+            if not attempt and reused and read_only and \
+                    isinstance(e, ConnectionError):
+                continue
+            return {"status": "error", "message": str(e)}
+        _db_pool.release(dbhost, dbport, s)
         return resp
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
 
 
 def handle_client(conn, addr, args):
     current_user_id = None
+    current_role = "player"
     try:
         while True:
             req = recv_message(conn)
@@ -110,8 +179,11 @@ def handle_client(conn, addr, args):
                 if act == "auth_login" and resp.get("status") == "success":
                     uid = resp["data"]["id"]
                     current_user_id = uid
-                    with _LOCK:
-                        _ONLINE_CLIENTS[uid] = conn
+                    current_role = dat.get("role", "player")
+                    # 開發者的 id 跟玩家是分開編號的，不能放進 _ONLINE_CLIENTS
+                    if current_role == "player":
+                        with _LOCK:
+                            _ONLINE_CLIENTS[uid] = conn
                     print(f"[Lobby] User {uid} logged in from {addr}")
                 if act == "logout" and resp.get("status") == "success":
                     current_user_id = None
@@ -125,14 +197,13 @@ def handle_client(conn, addr, args):
                 meta = dat.get("meta", {})
                 game_name = meta.get("game_name")
                 version = meta.get("version")
-                file_data = recv_file(conn)
-                print(
-                    f"[Lobby] Upload: {game_name} v{version} ({len(file_data)} bytes)")
                 save_dir = os.path.join("server_storage", "games", game_name)
                 os.makedirs(save_dir, exist_ok=True)
                 file_path = os.path.join(save_dir, f"{version}.zip")
-                with open(file_path, "wb") as f:
-                    f.write(file_data)
+                # 邊收邊寫入磁碟，不把整個 zip 放在記憶體
+                size = recv_file_to_path(conn, file_path)
+                print(
+                    f"[Lobby] Upload: {game_name} v{version} ({size} bytes)")
                 call_db(args.dbhost, args.dbport, {"action": "game_upsert", "data": {
                         "meta": meta, "file_path": file_path}})
                 send_message(conn, {"status": "success"})
@@ -145,13 +216,12 @@ def handle_client(conn, addr, args):
                 if game_info and os.path.exists(game_info.get("file_path", "")):
                     path = game_info["file_path"]
                     size = os.path.getsize(path)
-                    with open(path, "rb") as f:
-                        b = f.read()
                     send_message(conn, {"status": "success", "data": {
                         "size": size, "version": game_info["version"], "execution": game_info["execution"],
                         "min_players": game_info.get("min_players", 2), "max_players": game_info.get("max_players", 2)
                     }})
-                    send_file(conn, b)
+                    # 直接從磁碟串流，不先整個讀進記憶體
+                    send_file_from_path(conn, path)
                 else:
                     send_message(conn, {"status": "error",
                                  "message": "File not found"})
@@ -230,7 +300,7 @@ def handle_client(conn, addr, args):
     except Exception as e:
         print(f"[Lobby] Client error: {e}")
     finally:
-        if current_user_id:
+        if current_user_id and current_role == "player":
             with _LOCK:
                 if current_user_id in _ONLINE_CLIENTS:
                     del _ONLINE_CLIENTS[current_user_id]
@@ -1,6 +1,11 @@
 # lobby_server/lobby_server.py
-from utils.protocol import send_message, recv_message, recv_file, send_file
+from utils.protocol import send_message, recv_message, recv_file_to_path, send_file_from_path
+from utils.protocol import send_message_raw, recv_message_raw
 import argparse
+import hashlib
+import json
+import queue
+import select
 import socket
 import threading
 import os
@@ -8,38 +13,164 @@ import sys
 import subprocess
 import zipfile
 import random
+import shutil
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_server.db_server import unix_socket_path  # noqa: E402 (要在 sys.path 之後)
 
 # 判斷是否為 Windows
 IS_WINDOWS = os.name == 'nt'
 
+_WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "game_worker.py")
+
+
+def _zip_digest(zip_path):
+    # 上傳時會順便寫好 <zip>.sha256；舊的 zip 沒有的話第一次用到才算
+    side = zip_path + ".sha256"
+    try:
+        with open(side) as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    h = hashlib.sha256()
+    with open(zip_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with open(side, "w") as f:
+        f.write(digest)
+    return digest
+
+
+def _extract_parallel(zip_path, extract_path):
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        members = zf.infolist()
+        # 先建好所有目錄，避免多個執行緒同時 makedirs 互相衝突
+        for m in members:
+            target = os.path.dirname(os.path.join(extract_path, m.filename))
+            os.makedirs(target, exist_ok=True)
+        files = [m for m in members if not m.is_dir()]
+        if len(files) < 2:
+            zf.extractall(extract_path)
+            return
+        # 解壓縮 (zlib) 會放掉 GIL，多個檔案可以同時解
+        workers = min(os.cpu_count() or 1, len(files))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for fut in [ex.submit(zf.extract, m, extract_path) for m in files]:
+                fut.result()
+
+
+def _reuse_upload(src, dst):
+    # 新版本的內容跟 src 相同：zip 用 hard link (不支援時才複製)，
+    # 先放到暫存檔再 os.replace，跟一般上傳一樣不會留下半個檔案。
+    # .sha256 / .manifest 會被 open("w") 改寫，複製一份，不共用 inode
+    tmp = dst + ".part"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    for ext in (".sha256", ".manifest"):
+        if os.path.exists(src + ext):
+            shutil.copyfile(src + ext, dst + ext)
+        elif os.path.exists(dst + ext):
+            os.remove(dst + ext)  # 舊的 zip 沒有 .sha256：之後用到再算
+
+
+class GameWorkerPool:
+    """預先啟動的遊戲 worker 直譯器，開房時直接交付工作，省掉 Python 冷啟動"""
+
+    def __init__(self, size=2):
+        self.size = size
+        self._spare = queue.SimpleQueue()
+        for _ in range(size):
+            self._spare.put(self._spawn())
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [sys.executable, _WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+            start_new_session=True
+        )
+
+    def _replenish(self):
+        self._spare.put(self._spawn())
+
+    def start(self, script_abs, arg_list, cwd):
+        job = json.dumps({"script": script_abs, "args": arg_list,
+                          "cwd": cwd}).encode("utf-8") + b"\n"
+        while True:
+            try:
+                proc = self._spare.get_nowait()
+            except queue.Empty:
+                proc = self._spawn()  # 備用的用完了，只好現開一個
+            else:
+                # 背景補一個新的備用 worker，下次開房一樣是熱的
+                threading.Thread(target=self._replenish, daemon=True).start()
+            try:
+                proc.stdin.write(job)
+                proc.stdin.close()
+                return proc
+            except OSError:
+                proc.kill()  # worker 已經掛了，換下一個
+
 
 class GameExecutor:
     def __init__(self, storage_dir="server_storage/games", run_dir="server_running"):
         self.storage_dir = storage_dir
         self.run_dir = run_dir
         os.makedirs(self.run_dir, exist_ok=True)
+        self._pool = None
+        self._extract_lock = threading.Lock()
+
+    def start_pool(self, size):
+        # Windows 需要 CREATE_NEW_CONSOLE，沿用原本每局 Popen 的方式
+        if size > 0 and not IS_WINDOWS:
+            self._pool = GameWorkerPool(size)
 
     def _find_free_port(self):
+        # 直接試 bind：被佔用會立刻失敗，不用 connect 走一次 TCP 握手
+        # (範圍維持 30000-40000，對外開放的 port 不變)
         while True:
             port = random.randint(30000, 40000)
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                if s.connect_ex(('127.0.0.1', port)) != 0:
-                    return port
+                try:
+                    s.bind(("0.0.0.0", port))
+                except OSError:
+                    continue
+                return port
 
     def _prepare_game_files(self, game_name, version):
         zip_path = os.path.join(self.storage_dir, game_name, f"{version}.zip")
         extract_path = os.path.join(self.run_dir, game_name, version)
+        if not os.path.exists(zip_path):
+            raise FileNotFoundError(f"Game zip not found: {zip_path}")
+
+        with self._extract_lock:
+            # 解壓目錄記下 zip 的 SHA256，相同就不用重新解壓
+            # (同版本重新上傳時 hash 會不同，也就會重新解壓)
+            digest = _zip_digest(zip_path)
+            hash_path = os.path.join(extract_path, ".hash")
+            try:
+                with open(hash_path) as f:
+                    if f.read() == digest:
+                        return extract_path
+            except OSError:
+                pass
 
-        # 如果資料夾不存在或是空的就重新解壓
-        if not os.path.exists(extract_path) or not os.listdir(extract_path):
             print(f"[Executor] Extracting {game_name} v{version}...")
-            if not os.path.exists(zip_path):
-                raise FileNotFoundError(f"Game zip not found: {zip_path}")
-            with zipfile.ZipFile(zip_path, 'r') as zf:
-                zf.extractall(extract_path)
+            shutil.rmtree(extract_path, ignore_errors=True)
+            _extract_parallel(zip_path, extract_path)
+            with open(hash_path, "w") as f:
+                f.write(digest)
         return extract_path
 
     def start_game_process(self, game_meta, room_id, user_ids, public_host, db_host, db_port):
@@ -82,7 +213,10 @@ class GameExecutor:
 
         print(f"[Executor] Launching: {' '.join(map(str, cmd))}")
 
-        if IS_WINDOWS:
+        if self._pool is not None:
+            proc = self._pool.start(script_abs, [str(a) for a in cmd[2:]],
+                                    game_cwd)
+        elif IS_WINDOWS:
             proc = subprocess.Popen(
                 cmd, cwd=game_cwd, creationflags=subprocess.CREATE_NEW_CONSOLE)
         else:
@@ -98,25 +232,202 @@ class GameExecutor:
 
 
 _executor = GameExecutor()
+MAX_UPLOAD = 512 * 1024 * 1024  # chunked 上傳的總大小上限
 _room_game_map = {}
-_ONLINE_CLIENTS = {}
 _LOCK = threading.Lock()
+_open_conns = set()  # 連線中的 client，關機時一起中斷
 
+# 線上 client 依 uid 分成 16 個 shard，各自一把鎖，登入/廣播不再搶同一把
+_N_SHARDS = 16
+_SHARDS = [{} for _ in range(_N_SHARDS)]
+_SHARD_LOCKS = [threading.Lock() for _ in range(_N_SHARDS)]
 
-def call_db(dbhost, dbport, payload):
+
+def _shard(uid):
+    return hash(uid) & (_N_SHARDS - 1)
+
+
+def _put_client(uid, conn):
+    i = _shard(uid)
+    with _SHARD_LOCKS[i]:
+        _SHARDS[i][uid] = conn
+
+
+def _get_client(uid):
+    i = _shard(uid)
+    with _SHARD_LOCKS[i]:
+        return _SHARDS[i].get(uid)
+
+
+def _pop_client(uid):
+    i = _shard(uid)
+    with _SHARD_LOCKS[i]:
+        return _SHARDS[i].pop(uid, None)
+
+
+# 池中連線最多閒置幾秒；要比 DB 的 IDLE_TIMEOUT 短，避免拿到 DB 正要關的連線
+POOL_IDLE = 3.0
+
+
+def _is_idle_alive(s):
+    # 閒置的連線上不該有資料可讀；可讀代表 DB 已關閉連線 (例如 DB 重開)，
+    # 在送出請求前就丟掉，不必等請求失敗再重送
     try:
-        s = socket.create_connection((dbhost, dbport), timeout=5)
-        send_message(s, payload)
-        resp = recv_message(s)
+        readable, _, _ = select.select([s], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+class DBPool:
+    """到 DB server 的持久連線池，省掉每個請求的連線建立/關閉"""
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size  # 每個 (host, port) 最多保留幾條閒置連線
+        self.unix_path = None  # 同機 DB 的 UNIX socket (--db-unix)
+        self._unix_warned = False
+        self.idle = {}  # (host, port) -> deque[(socket, 放回池中的時間)]
+        self.lock = threading.Lock()
+
+    def acquire(self, host, port):
+        """回傳 (socket, 是否為重複使用的連線)"""
+        while True:
+            with self.lock:
+                q = self.idle.get((host, port))
+                s, since = q.pop() if q else (None, 0)
+            if s is None:
+                break
+            # 閒置太久的連線 DB 隨時會關掉，不拿來送請求
+            if time.monotonic() - since < POOL_IDLE and _is_idle_alive(s):
+                return s, True
+            s.close()
+        if self.unix_path and hasattr(socket, "AF_UNIX") and \
+                host in ("127.0.0.1", "localhost"):
+            s = self._connect_unix()
+            if s is not None:
+                return s, False
+        s = socket.create_connection((host, port), timeout=5)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return s, False
+
+    def _connect_unix(self):
+        # DB 以 --unix 啟動時會多聽一個 UNIX socket；沒有就退回 TCP
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(5)
+        try:
+            s.connect(self.unix_path)
+        except OSError as e:  # 檔案不存在 / DB 沒在聽
+            s.close()
+            if not self._unix_warned:  # 只提示一次，不要每個請求都印
+                self._unix_warned = True
+                print(f"[Lobby] DB UNIX socket {self.unix_path} unavailable "
+                      f"({e}), falling back to TCP")
+            return None
+        self._unix_warned = False
+        return s
+
+    def release(self, host, port, s):
+        with self.lock:
+            q = self.idle.setdefault((host, port), deque())
+            if len(q) < self.max_size:
+                q.append((s, time.monotonic()))
+                return
         s.close()
+
+
+_db_pool = DBPool()
+
+
+# 重送不會改變 DB 內容的請求
+_READ_ONLY = frozenset(("game_get", "game_list", "list_public", "list_online",
+                        "review_list"))
+
+
+def _db_request(dbhost, dbport, payload, recv):
+    read_only = payload.get("action") in _READ_ONLY
+    for attempt in range(2):
+        try:
+            s, reused = _db_pool.acquire(dbhost, dbport)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        try:
+            send_message(s, payload)
+            resp = recv(s)
+        except Exception as e:
+            s.close()
+            # 舊連線在檢查之後才斷掉時換一條新的重試一次；寫入類的請求
+            # DB 可能已經執行過 (例如斷在 recv)，不能重送
+            if not attempt and reused and read_only and \
+                    isinstance(e, ConnectionError):
+                continue
+            return {"status": "error", "message": str(e)}
+        _db_pool.release(dbhost, dbport, s)
         return resp
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+
+
+def call_db(dbhost, dbport, payload):
+    return _db_request(dbhost, dbport, payload, recv_message)
+
+
+def call_db_raw(dbhost, dbport, payload):
+    """回傳 DB 回應的原始 JSON bytes，給 lobby 不看內容、直接轉送的請求用"""
+    resp = _db_request(dbhost, dbport, payload, recv_message_raw)
+    if isinstance(resp, dict):  # 連不上 DB 時的錯誤訊息
+        return json.dumps(resp).encode("utf-8")
+    return resp
+
+
+# 遊戲資料很少變動：game_get / game_list 的結果快取在 lobby，
+# 上架/刪除時清掉，另外加 TTL 以防萬一 (例如其他 lobby 改了 DB)
+GAME_CACHE_TTL = 30.0
+_game_cache = {}  # name -> (到期時間, game_get 回應)
+_game_list_cache = None  # (到期時間, game_list 回應)
+_game_cache_gen = 0  # 每次清快取 +1，避免把清之前查到的舊資料放回去
+_game_cache_lock = threading.Lock()
+
+
+def get_game_cached(dbhost, dbport, name):
+    with _game_cache_lock:
+        hit = _game_cache.get(name)
+        gen = _game_cache_gen
+    if hit and hit[0] > time.time():
+        return hit[1]
+    resp = call_db(dbhost, dbport, {
+                   "action": "game_get", "data": {"name": name}})
+    if resp.get("status") == "success":
+        with _game_cache_lock:
+            if gen == _game_cache_gen:
+                _game_cache[name] = (time.time() + GAME_CACHE_TTL, resp)
+    return resp
+
+
+def get_game_list_cached(dbhost, dbport, req):
+    global _game_list_cache
+    with _game_cache_lock:
+        hit = _game_list_cache
+        gen = _game_cache_gen
+    if hit and hit[0] > time.time():
+        return hit[1]
+    resp = call_db(dbhost, dbport, req)
+    if resp.get("status") == "success":
+        with _game_cache_lock:
+            if gen == _game_cache_gen:
+                _game_list_cache = (time.time() + GAME_CACHE_TTL, resp)
+    return resp
+
+
+def invalidate_game(name):
+    global _game_list_cache, _game_cache_gen
+    with _game_cache_lock:
+        _game_cache.pop(name, None)
+        _game_list_cache = None
+        _game_cache_gen += 1
 
 
 def handle_client(conn, addr, args):
     current_user_id = None
     current_username = None
+    current_role = "player"
     try:
         while True:
             req = recv_message(conn)
@@ -126,15 +437,23 @@ def handle_client(conn, addr, args):
             dat = req.get("data") or {}
 
             # Auth & Forwarding
-            if act in ("auth_register", "auth_login", "logout", "list_online"):
+            if act in ("auth_register", "list_online"):
+                send_message_raw(conn, call_db_raw(
+                    args.dbhost, args.dbport, req))
+
+            elif act in ("auth_login", "logout"):
                 resp = call_db(args.dbhost, args.dbport, req)
                 if act == "auth_login" and resp.get("status") == "success":
                     uid = resp["data"]["id"]
                     current_user_id = uid
                     current_username = resp["data"]["username"]
-                    with _LOCK:
-                        _ONLINE_CLIENTS[uid] = conn
-                    print(f"[Lobby] User {uid} logged in from {addr}")
+                    current_role = dat.get("role", "player")
+                    # 開發者的 id 跟玩家是分開編號的，不能放進玩家的 shard，
+                    # 否則同 id 玩家的 START 封包會送到開發者的連線
+                    if current_role == "player":
+                        _put_client(uid, conn)
+                    print(f"[Lobby] User {uid} ({current_role}) "
+                          f"logged in from {addr}")
 
                 if act == "logout" and resp.get("status") == "success":
                     current_user_id = None
@@ -143,39 +462,83 @@ def handle_client(conn, addr, args):
                 send_message(conn, resp)
 
             # Game Store
-            elif act in ("game_upsert", "game_delete", "game_list"):
-                resp = call_db(args.dbhost, args.dbport, req)
+            elif act == "game_list":
+                resp = get_game_list_cached(args.dbhost, args.dbport, req)
                 send_message(conn, resp)
 
+            elif act in ("game_upsert", "game_delete"):
+                raw = call_db_raw(args.dbhost, args.dbport, req)
+                invalidate_game(dat.get("game_name") or
+                                (dat.get("meta") or {}).get("game_name"))
+                send_message_raw(conn, raw)
+
             elif act == "upload_game":
                 meta = dat.get("meta", {})
                 game_name = meta.get("game_name")
                 version = meta.get("version")
-                file_data = recv_file(conn)
-                print(
-                    f"[Lobby] Upload: {game_name} v{version} ({len(file_data)} bytes)")
-
                 save_dir = os.path.join("server_storage", "games", game_name)
                 os.makedirs(save_dir, exist_ok=True)
                 file_path = os.path.join(save_dir, f"{version}.zip")
-                with open(file_path, "wb") as f:
-                    f.write(file_data)
+                # 舊的 manifest 先刪掉，上傳失敗時不會被誤認成新內容
+                manifest_path = file_path + ".manifest"
+                if os.path.exists(manifest_path):
+                    os.remove(manifest_path)
+                # 邊收邊寫入磁碟，不把整個 zip 放在記憶體；順便算 SHA256
+                # (chunked: client 邊壓縮邊送，事先不知道大小)
+                h = hashlib.sha256()
+                size = recv_file_to_path(conn, file_path, hasher=h,
+                                         chunked=bool(dat.get("chunked")),
+                                         limit=MAX_UPLOAD)
+                with open(file_path + ".sha256", "w") as f:
+                    f.write(h.hexdigest())
+                if dat.get("manifest"):
+                    with open(manifest_path, "w") as f:
+                        f.write(dat["manifest"])
+                print(
+                    f"[Lobby] Upload: {game_name} v{version} ({size} bytes)")
 
                 # 寫入 DB
                 call_db(args.dbhost, args.dbport, {"action": "game_upsert", "data": {
                         "meta": meta, "file_path": file_path}})
+                invalidate_game(game_name)
                 send_message(conn, {"status": "success"})
 
+            elif act == "game_check_hash":
+                # client 專案內容 (manifest，不含版本號) 與 server 上該遊戲
+                # 最新的 zip 相同時，把那個 zip 放到新版本的路徑並更新 DB，
+                # 省掉重新打包與上傳
+                meta = dat.get("meta", {})
+                game_name = meta.get("game_name")
+                file_path = os.path.join("server_storage", "games", game_name,
+                                         f"{meta.get('version')}.zip")
+                manifest = dat.get("manifest")
+                latest = (get_game_cached(args.dbhost, args.dbport, game_name)
+                          .get("data") or {}).get("file_path", "")
+                try:
+                    with open(latest + ".manifest") as f:
+                        same = bool(manifest) and f.read() == manifest
+                except OSError:
+                    same = False
+                if not same or not os.path.exists(latest):
+                    send_message(conn, {"status": "success",
+                                        "data": {"exists": False}})
+                    continue
+                if os.path.abspath(latest) != os.path.abspath(file_path):
+                    _reuse_upload(latest, file_path)
+                resp = call_db(args.dbhost, args.dbport, {"action": "game_upsert", "data": {
+                    "meta": meta, "file_path": file_path}})
+                invalidate_game(game_name)
+                if resp.get("status") == "success":
+                    resp = {"status": "success", "data": {"exists": True}}
+                send_message(conn, resp)
+
             elif act == "download_game":
                 game_name = dat.get("game_name")
-                db_resp = call_db(args.dbhost, args.dbport, {
-                                  "action": "game_get", "data": {"name": game_name}})
+                db_resp = get_game_cached(args.dbhost, args.dbport, game_name)
                 game_info = db_resp.get("data")
                 if game_info and os.path.exists(game_info.get("file_path", "")):
                     path = game_info["file_path"]
                     size = os.path.getsize(path)
-                    with open(path, "rb") as f:
-                        b = f.read()
                     send_message(conn, {
                         "status": "success",
                         "data": {
@@ -186,7 +549,8 @@ def handle_client(conn, addr, args):
                             "max_players": game_info.get("max_players", 2)
                         }
                     })
-                    send_file(conn, b)
+                    # 直接從磁碟串流，不先整個讀進記憶體
+                    send_file_from_path(conn, path)
                 else:
                     send_message(conn, {"status": "error",
                                  "message": "File not found"})
@@ -194,8 +558,8 @@ def handle_client(conn, addr, args):
             # Room Management
             elif act == "create_room":
                 game_name = dat.get("game_name")
-                game_resp = call_db(args.dbhost, args.dbport, {
-                                    "action": "game_get", "data": {"name": game_name}})
+                game_resp = get_game_cached(
+                    args.dbhost, args.dbport, game_name)
                 if not game_resp.get("data"):
                     send_message(conn, {"status": "error",
                                  "message": "Unknown game"})
@@ -206,8 +570,7 @@ def handle_client(conn, addr, args):
                     room_id = resp["data"]["id"]
                     user_id = dat.get("user_id")
                     if user_id:
-                        with _LOCK:
-                            _ONLINE_CLIENTS[user_id] = conn
+                        _put_client(user_id, conn)
                     with _LOCK:
                         _room_game_map[room_id] = game_resp["data"]
                 send_message(conn, resp)
@@ -215,8 +578,7 @@ def handle_client(conn, addr, args):
             elif act == "accept":
                 user_id = dat.get("user_id")
                 if user_id:
-                    with _LOCK:
-                        _ONLINE_CLIENTS[user_id] = conn
+                    _put_client(user_id, conn)
 
                 resp = call_db(args.dbhost, args.dbport, req)
                 send_message(conn, resp)
@@ -251,17 +613,15 @@ def handle_client(conn, addr, args):
                                 }
 
                                 send_message(conn, start_packet)
-                                for uid in users:
-                                    if uid == user_id:
-                                        continue
-                                    with _LOCK:
-                                        p_conn = _ONLINE_CLIENTS.get(uid)
-                                        if p_conn:
-                                            try:
-                                                send_message(
-                                                    p_conn, start_packet)
-                                            except:
-                                                pass
+                                # 先取出對象再送，送資料時不持有任何鎖
+                                targets = [_get_client(uid) for uid in users
+                                           if uid != user_id]
+                                for p_conn in targets:
+                                    if p_conn:
+                                        try:
+                                            send_message(p_conn, start_packet)
+                                        except:
+                                            pass
                             except Exception as e:
                                 print(f"[Error] Start game failed: {e}")
 
@@ -276,20 +636,19 @@ def handle_client(conn, addr, args):
                 send_message(conn, {"status": "success", "data": rooms})
 
             else:
-                resp = call_db(args.dbhost, args.dbport, req)
-                send_message(conn, resp)
+                send_message_raw(conn, call_db_raw(
+                    args.dbhost, args.dbport, req))
 
     except Exception as e:
         print(f"[Lobby] Client error: {e}")
     finally:
         if current_user_id:
-            with _LOCK:
-                if current_user_id in _ONLINE_CLIENTS:
-                    del _ONLINE_CLIENTS[current_user_id]
+            if current_role == "player":
+                _pop_client(current_user_id)
             if current_username:
                 try:
                     call_db(args.dbhost, args.dbport, {
-                        "action": "logout", "data": {"username": current_username, "role": "player"}
+                        "action": "logout", "data": {"username": current_username, "role": current_role}
                     })
                 except:
                     pass
@@ -299,14 +658,37 @@ def handle_client(conn, addr, args):
             pass
 
 
+def _serve(conn, addr, args, slots):
+    with _LOCK:
+        _open_conns.add(conn)
+    try:
+        handle_client(conn, addr, args)
+    finally:
+        with _LOCK:
+            _open_conns.discard(conn)
+        slots.release()
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--port", type=int, default=10002)
     ap.add_argument("--dbhost", default="127.0.0.1")
     ap.add_argument("--dbport", type=int, default=10001)
     ap.add_argument("--public-host", required=True)
+    ap.add_argument("--db-unix", default=None, metavar="PATH",
+                    help="DB 的 UNIX socket (預設與 db_server --unix 相同："
+                         "/tmp/np_db.<dbport>.sock；空字串 = 只用 TCP)")
+    ap.add_argument("--max-clients", type=int, default=128,
+                    help="同時連線的 client 上限 (執行緒池大小)")
+    ap.add_argument("--game-workers", type=int, default=2,
+                    help="預熱的遊戲 worker 數量 (0 = 每局重新啟動 Python)")
     args = ap.parse_args()
 
+    _executor.start_pool(args.game_workers)
+    if args.db_unix is None and not IS_WINDOWS:
+        args.db_unix = unix_socket_path(args.dbport)
+    _db_pool.unix_path = args.db_unix or None
+
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind(("0.0.0.0", args.port))
@@ -315,15 +697,35 @@ def main():
     print(f"[Lobby] Listening on 0.0.0.0:{args.port}")
     print(f"[Lobby] Public Host advertised as: {args.public_host}")
 
+    # 固定大小的執行緒池；client 連線會一直佔用 worker，
+    # 所以滿了就直接回 busy，不讓新連線在佇列裡空等
+    pool = ThreadPoolExecutor(max_workers=args.max_clients,
+                              thread_name_prefix="lobby")
+    slots = threading.BoundedSemaphore(args.max_clients)
     try:
         while True:
             c, a = s.accept()
-            threading.Thread(target=handle_client, args=(
-                c, a, args), daemon=True).start()
+            if not slots.acquire(blocking=False):
+                try:
+                    send_message(c, {"status": "error",
+                                     "message": "Server busy"})
+                except OSError:
+                    pass
+                c.close()
+                continue
+            pool.submit(_serve, c, a, args, slots)
     except KeyboardInterrupt:
         print("\nShutting down...")
     finally:
         s.close()
+        # 叫醒卡在 recv 的 worker，讓執行緒池可以結束
+        with _LOCK:
+            for c in _open_conns:
+                try:
+                    c.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == "__main__":
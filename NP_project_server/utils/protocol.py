@@ -1,13 +1,53 @@
 # utils/protocol.py
 import struct
 import json
+import os
 import socket
 
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫
+    orjson = None
+
+# 長度前綴 (4 bytes, big-endian)，格式字串只解析一次
+_HDR = struct.Struct('!I')
+HEADER_SIZE = _HDR.size  # == 4
+
+
+def _encode(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+# 小於這個大小的封包直接串接後一次送出 (複製成本很小，也避免 Nagle 延遲)
+_CONCAT_LIMIT = 16 * 1024
+
+
+def _send_framed(sock, body):
+    header = _HDR.pack(len(body))
+    if len(body) < _CONCAT_LIMIT:
+        sock.sendall(header + body)
+        return
+    if not hasattr(sock, 'sendmsg'):  # Windows 沒有 sendmsg
+        sock.sendall(header)
+        sock.sendall(body)
+        return
+    # scatter-gather: header 與 body 一起交給 kernel，不先複製成一整塊
+    parts = [memoryview(header), memoryview(body)]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while sent:
+            if sent >= len(parts[0]):
+                sent -= len(parts[0])
+                parts.pop(0)
+            else:
+                parts[0] = parts[0][sent:]
+                sent = 0
+
 
 def send_message(sock, data):
     try:
-        msg = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        sock.sendall(struct.pack('!I', len(msg)) + msg)
+        _send_framed(sock, _encode(data))
     except Exception as e:
         print(f"[Protocol] Send Error: {e}")
         raise e
@@ -15,33 +55,149 @@ def send_message(sock, data):
 
 def recv_message(sock):
     try:
-        header = _readn(sock, 4)
+        header = _readn(sock, HEADER_SIZE)
         if not header:
             return None
-        (length,) = struct.unpack('!I', header)
+        (length,) = _HDR.unpack_from(header)
         body = _readn(sock, length)
-        return json.loads(body.decode('utf-8'))
+        if orjson is not None:
+            return orjson.loads(body)
+        return json.loads(body)
     except Exception as e:
         # print(f"[Protocol] Recv Error: {e}")
         raise e
 
 
+def send_message_raw(sock, body):
+    # body 是已經編碼好的 JSON (例如 DB 的回應)，原封不動轉送，不再 parse/dump
+    _send_framed(sock, body)
+
+
+def recv_message_raw(sock):
+    # 只拆封包，不 parse，回傳 body 原始 bytes
+    header = _readn(sock, HEADER_SIZE)
+    (length,) = _HDR.unpack_from(header)
+    return _readn(sock, length)
+
+
 def send_file(sock, file_data):
     # 簡單傳檔協定: 長度(4 bytes) + 內容
-    sock.sendall(struct.pack('!I', len(file_data)) + file_data)
+    _send_framed(sock, file_data)
 
 
 def recv_file(sock):
-    header = _readn(sock, 4)
-    (length,) = struct.unpack('!I', header)
+    header = _readn(sock, HEADER_SIZE)
+    (length,) = _HDR.unpack_from(header)
     return _readn(sock, length)
 
 
+def send_file_from_path(sock, path):
+    # 串流傳送檔案 (Linux 上 socket.sendfile 走 os.sendfile，零複製)
+    with open(path, 'rb') as f:
+        return send_fileobj(sock, f)
+
+
+def send_fileobj(sock, f):
+    # 從已開啟的檔案 (例如 TemporaryFile) 從頭串流送出整個檔案
+    f.flush()
+    size = os.fstat(f.fileno()).st_size
+    sock.sendall(_HDR.pack(size))
+    sock.sendfile(f, 0, size)
+    return size
+
+
+def _copy_n(sock, fileobj, n, view, hasher):
+    # 從 sock 讀剛好 n bytes 寫進 fileobj，每次最多一個 view 的大小
+    while n:
+        got = sock.recv_into(view[:min(len(view), n)])
+        if not got:
+            raise ConnectionError("Connection closed")
+        fileobj.write(view[:got])
+        if hasher is not None:
+            hasher.update(view[:got])
+        n -= got
+
+
+def recv_file_into(sock, fileobj, chunk=1 << 20, hasher=None):
+    # 邊收邊寫入 fileobj，記憶體用量最多一個 chunk，與檔案大小無關
+    # hasher (例如 hashlib.sha256()) 會順便對每個 chunk 做 update
+    header = _readn(sock, HEADER_SIZE)
+    (length,) = _HDR.unpack_from(header)
+    _copy_n(sock, fileobj, length, memoryview(bytearray(min(chunk, length) or 1)),
+            hasher)
+    return length
+
+
+# chunked 傳檔：事先不知道總長度時 (例如邊壓縮邊送)，資料切成多個
+# 長度(4 bytes) + 內容 的區塊，最後送一個長度 0 的區塊表示結束
+class ChunkedWriter:
+    """只有 write() 的 file-like 物件 (可直接交給 zipfile)，
+    寫入的資料累積到 block 大小就送出一個 chunk"""
+
+    def __init__(self, sock, block=1 << 20):
+        self.sock = sock
+        self.block = block
+        self.buf = bytearray()
+        self.size = 0  # 已寫入的總 bytes
+
+    def write(self, data):
+        self.buf += data
+        self.size += len(data)
+        if len(self.buf) >= self.block:
+            _send_framed(self.sock, self.buf)
+            self.buf = bytearray()
+        return len(data)
+
+    def flush(self):
+        pass  # 不足一個 block 的資料等 close 再送，避免很多小 chunk
+
+    def close(self):
+        if self.buf:
+            _send_framed(self.sock, self.buf)
+            self.buf = bytearray()
+        self.sock.sendall(_HDR.pack(0))
+        return self.size
+
+
+def recv_chunked_into(sock, fileobj, chunk=1 << 20, hasher=None, limit=None):
+    # 收 ChunkedWriter 送來的資料直到長度 0 的區塊；limit 限制總大小
+    view = memoryview(bytearray(chunk))
+    total = 0
+    while True:
+        (n,) = _HDR.unpack_from(_readn(sock, HEADER_SIZE))
+        if not n:
+            return total
+        total += n
+        if limit is not None and total > limit:
+            raise ValueError("File too large")
+        _copy_n(sock, fileobj, n, view, hasher)
+
+
+def recv_file_to_path(sock, path, chunk=1 << 20, hasher=None, chunked=False,
+                      limit=None):
+    # 先寫入暫存檔，收完才換成正式檔名
+    tmp = path + '.part'
+    try:
+        with open(tmp, 'wb') as f:
+            if chunked:
+                length = recv_chunked_into(sock, f, chunk, hasher, limit)
+            else:
+                length = recv_file_into(sock, f, chunk, hasher)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return length
+
+
 def _readn(sock, n):
-    buf = b''
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+    # 預先配置緩衝區直接 recv_into，避免 buf += chunk 每次都整段複製 (O(N^2))
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:], n - pos)
+        if not got:
             raise ConnectionError("Connection closed")
-        buf += chunk
+        pos += got
     return buf
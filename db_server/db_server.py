@@ -1,46 +1,253 @@
 # db_server/db_server.py
 import argparse
+import hashlib
+import hmac
 import json
+import logging
+import mmap
 import socket
+import sqlite3
 import struct
 import threading
 import sys
 import os
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫
+    orjson = None
+
+log = logging.getLogger("db")
 
 MAX_LEN = 65536
+# 單筆請求上限：目前最大的是 game_upsert 的 meta，遠小於這個值
+REQ_MAX_LEN = 16384
+_HDR = struct.Struct("!I")  # 4-byte 長度前綴
+# 小於這個大小的回應直接串接 header 後一次送出 (複製成本比多一個 iovec 小)
+_CONCAT_LIMIT = 16 * 1024
+FLUSH_INTERVAL = 0.5  # 背景執行緒檢查間隔 (秒)
+SNAPSHOT_INTERVAL = 30.0  # 日誌有新紀錄時，最久多少秒重寫一次快照
+SNAPSHOT_EVERY = 500  # 日誌累積多少筆就提早重寫快照
+MAX_WORKERS = 64  # 處理連線的執行緒池大小
+N_AUTH_SHARDS = 16  # 帳號鎖依 username 雜湊分片 (須為 2 的次方)
+# 持久連線閒置多久就關掉，把 worker 還給執行緒池；每條連線佔一個 worker，
+# 要短到 lobby 池裡的閒置連線不會把 MAX_WORKERS 佔滿 (lobby 只留 3 秒內用過的)
+IDLE_TIMEOUT = 5.0
 
 
-def _readn(sock, n):
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+def _default(obj):
+    # play_history 在記憶體中是 set，寫出時轉成排序過的 list
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def _encode(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+def _decode(data):
+    # orjson 直接吃 bytes/bytearray，不必先 decode 成 str
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# 密碼只存 keyed BLAKE2b 雜湊 (前綴 "b2$")；PEPPER 不存在 DB 檔裡
+# (最長 64 bytes)。舊資料的明文密碼登入成功時會換成雜湊
+PEPPER = os.environ.get("NP_DB_PEPPER", "").encode("utf-8")[:64]
+_PW_PREFIX = "b2$"
+
+
+def _hash_password(password):
+    digest = hashlib.blake2b(str(password).encode("utf-8"), key=PEPPER,
+                             digest_size=32).hexdigest()
+    return _PW_PREFIX + digest
+
+
+def _check_password(stored, password, hashed):
+    # hashed 是 _hash_password(password)；一律用 compare_digest (常數時間)
+    stored = stored or ""
+    if stored.startswith(_PW_PREFIX):
+        return hmac.compare_digest(stored, hashed)
+    return hmac.compare_digest(stored.encode("utf-8"),
+                               str(password).encode("utf-8"))
+
+
+# 成功回應的外層固定不變：預先編好前綴，只編碼 data 再接起來
+_OK_PREFIX = b'{"status":"success","data":'
+
+
+def _encode_ok(data):
+    return b"".join((_OK_PREFIX, _encode(data), b"}"))
+
+
+def _dumps_line(obj):
+    return _encode(obj) + b"\n"
+
+
+def _write_atomic(path, body):
+    # 先寫暫存檔再 rename，當機時不會留下寫一半的檔案。
+    # rename 前先 fsync：快照寫完緊接著就截斷日誌，若資料還在 page cache
+    # 就斷電，可能快照是空檔、日誌也已清掉 (快照在背景執行緒寫，不影響請求)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+_tls = threading.local()  # 每條執行緒重複使用的 header 緩衝區
+
+
+def _recv_into(sock, buf):
+    # 把 buf 整個填滿；對方關線就丟 ConnectionError
+    view = memoryview(buf)
+    n = len(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:], n - pos)
+        if not got:
             raise ConnectionError("Socket closed")
-        buf += chunk
+        pos += got
     return buf
 
 
+def _readn(sock, n):
+    # 預先配置緩衝區直接 recv_into，避免 buf += chunk 反覆複製
+    return _recv_into(sock, bytearray(n))
+
+
 def send_message(sock, obj):
-    body = json.dumps(obj, ensure_ascii=False,
-                      separators=(",", ":")).encode("utf-8")
-    sock.sendall(struct.pack("!I", len(body)) + body)
+    send_raw(sock, _encode(obj))
 
 
-def recv_message(sock):
-    header = _readn(sock, 4)
-    (n,) = struct.unpack("!I", header)
-    if n > MAX_LEN:
+def send_raw(sock, body):
+    """送出已序列化好的 body (快取的回應直接走這裡)"""
+    header = _HDR.pack(len(body))
+    if len(body) < _CONCAT_LIMIT or not hasattr(sock, "sendmsg"):
+        sock.sendall(header + body)
+        return
+    # 大回應 (例如 game_list) 用 scatter-gather 一起交給 kernel，
+    # 不為了加 4 bytes header 再複製整個 body
+    parts = [memoryview(header), memoryview(body)]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while sent:
+            if sent >= len(parts[0]):
+                sent -= len(parts[0])
+                parts.pop(0)
+            else:
+                parts[0] = parts[0][sent:]
+                sent = 0
+
+
+def recv_message(sock, limit=MAX_LEN):
+    hdr = getattr(_tls, "hdr", None)
+    if hdr is None:
+        hdr = _tls.hdr = bytearray(_HDR.size)
+    (n,) = _HDR.unpack_from(_recv_into(sock, hdr))
+    if n > limit:
+        # 只看 header 就拒絕，不把超大的 body 讀進來
         raise ValueError("Message too large")
-    body = _readn(sock, n)
-    return json.loads(body.decode("utf-8"))
+    return _decode(_readn(sock, n))
 
 
-class SimpleStorage:
-    def __init__(self, db_path):
+class RWLock:
+    """讀寫鎖: 讀者可同時進入，寫者獨占 (有寫者等待時新讀者先排隊)"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class ResponseCache:
+    """唯讀列表回應的序列化快取，相關資料修改時由 _invalidate 清除
+    (SimpleStorage 與 SqliteStorage 共用)"""
+
+    def __init__(self):
+        self._cache = {}
+        self._cache_ver = {}
+        self._cache_lock = threading.Lock()
+
+    def cached_response(self, key, build):
+        """回傳 {"status": "success", "data": build()} 序列化後的 bytes，
+        在 key 對應的資料被修改前重複使用"""
+        body = self._cache.get(key)
+        if body is None:
+            ver = self._cache_ver.get(key, 0)
+            body = _encode_ok(build())
+            # build() 期間若有寫入者清除過快取，這份結果可能已過期，不存
+            with self._cache_lock:
+                if self._cache_ver.get(key, 0) == ver:
+                    self._cache[key] = body
+        return body
+
+    def _invalidate(self, key):
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            self._cache_ver[key] = self._cache_ver.get(key, 0) + 1
+
+
+class SimpleStorage(ResponseCache):
+    def __init__(self, db_path, pretty=False):
+        super().__init__()
         self.db_path = db_path
-        self.lock = threading.Lock()
+        self.pretty = pretty  # 快照是否縮排 (只為了方便人工檢視)
+        # 每種資源各一把讀寫鎖，互不相干的修改不再互相等待。
+        # 需要多把時一律依 _locks 的順序取得，避免死結
+        self.players_lock = RWLock()  # players + developers
+        # 註冊/登入/登出只拿 players_lock 讀鎖 + 該 username 分片的寫鎖，
+        # 不同帳號的操作可以同時進行；分片鎖排在 players_lock 之後
+        self._auth_locks = [RWLock() for _ in range(N_AUTH_SHARDS)]
+        self._id_lock = threading.Lock()  # 保護 nexts 的 player/developer 編號
+        self.games_lock = RWLock()
+        self.rooms_lock = RWLock()
+        self.reviews_lock = RWLock()
+        self.history_lock = RWLock()
+        self._locks = (self.players_lock, *self._auth_locks, self.games_lock,
+                       self.rooms_lock, self.reviews_lock, self.history_lock)
+        self._log_lock = threading.Lock()  # 保護 _seq / _journal / 日誌 fd
+        self._game_list_view = None  # game_list() 的結果，遊戲變動時清掉
         self.data = {
             "players": [],
             "developers": [],
@@ -51,28 +258,37 @@ class SimpleStorage:
             "play_history": {},
             "nexts": {"player": 1, "developer": 1, "room": 1}
         }
+        # 每次修改只在日誌 (db_path.log) 附加一行，由背景執行緒定期
+        # 寫出完整快照並截斷日誌
+        self.journal_path = self.db_path + ".log"
+        self._seq = 0  # 最後一筆日誌的序號，快照中記為 journal_seq
+        self._journal = []  # 快照之後新增的 (seq, line)
+        self._last_snapshot = time.time()
+        self.dirty = threading.Event()
+        self.stop = threading.Event()
         self.load()
+        self._journal_fd = self._open_journal()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
 
     # db_server/db_server.py (約 60 行附近)
 
     def load(self):
         if os.path.exists(self.db_path):
             try:
-                with open(self.db_path, "r", encoding="utf-8") as f:
-                    loaded = json.load(f)
-                    # ... (原本的載入邏輯) ...
-                    for k in self.data.keys():
-                        if k in loaded:
-                            self.data[k] = loaded[k]
+                loaded = self._read_snapshot()
+                # ... (原本的載入邏輯) ...
+                for k in self.data.keys():
+                    if k in loaded:
+                        self.data[k] = loaded[k]
+                self._seq = int(loaded.get("journal_seq", 0))
 
                 # 確保 play_history 是字典
                 if isinstance(self.data.get("play_history"), list):
                     self.data["play_history"] = {}
-
-                # === [新增] 強制重置所有玩家為離線 ===
-                for p in self.data["players"]:
-                    p["online"] = False
-                # ====================================
+                # 遊玩紀錄改用 set，成員檢查 O(1)
+                self.data["play_history"] = {
+                    k: set(v) for k, v in self.data["play_history"].items()}
 
                 print(
                     f"[Storage] Loaded DB from {self.db_path} (All users reset to offline)")
@@ -81,93 +297,260 @@ class SimpleStorage:
         else:
             print("[Storage] No DB file found, starting new.")
             self.save()
-    
+        self._build_index()
+        self._replay_journal()
+
+        # === [新增] 強制重置所有玩家為離線 ===
+        for p in self.data["players"]:
+            p["online"] = False
+        # 線上名單只看這個 set，不必每次掃過全部玩家
+        self._online_ids = set()
+        # ====================================
+
+    def _read_snapshot(self):
+        # mmap 後直接交給 orjson 解析，不必先把整個檔案讀成另一份 bytes
+        with open(self.db_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return {}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if orjson is None:
+                    return json.loads(mm[:])
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+
+    def _build_index(self):
+        # 以 id / username / name 建立索引，查詢不必線性掃描
+        # (reversed: 名稱重複時保留第一筆，與原本的掃描結果一致)
+        players = self.data["players"]
+        self._players_by_id = {p["id"]: p for p in reversed(players)}
+        self._players_by_username = {
+            p["username"]: p for p in reversed(players)}
+        self._devs_by_username = {
+            u["username"]: u for u in reversed(self.data["developers"])}
+        self._games_by_name = {
+            g["name"]: g for g in reversed(self.data["games"])}
+        self._rooms_by_id = {r["id"]: r for r in reversed(self.data["rooms"])}
+
+    # --- 日誌 (append-only journal) ---
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    rec = _decode(line)
+                except ValueError:
+                    break  # 當機時寫到一半的最後一行
+                seq = rec.get("seq", 0)
+                if seq <= self._seq:
+                    continue  # 已包含在快照中
+                self._apply(rec)
+                self._seq = seq
+                self._journal.append((seq, line))
+        if self._journal:
+            self.dirty.set()
+            print(f"[Storage] Replayed {len(self._journal)} journal records")
+
+    def _apply(self, rec):
+        """把一筆日誌套用到 self.data 與索引 (重播用)"""
+        op = rec["op"]
+        if op == "put":
+            coll, row = rec["coll"], rec["row"]
+            if coll == "games":
+                index, key = self._games_by_name, row["name"]
+            elif coll == "rooms":
+                index, key = self._rooms_by_id, row["id"]
+            elif coll == "developers":
+                index, key = self._devs_by_username, row["username"]
+            else:
+                index, key = self._players_by_username, row["username"]
+            target = index.get(key)
+            if target is None:
+                self.data[coll].append(row)
+                index[key] = row
+                if coll == "players":
+                    self._players_by_id[row["id"]] = row
+            else:
+                target.clear()
+                target.update(row)
+            if coll != "games":
+                kind = coll[:-1]
+                nexts = self.data["nexts"]
+                nexts[kind] = max(nexts.get(kind, 1), row["id"] + 1)
+        elif op == "del":
+            g = self._games_by_name.pop(rec["key"], None)
+            if g is not None:
+                self.data["games"].remove(g)
+        elif op == "review":
+            self.data["reviews"].append(rec["row"])
+        elif op == "history":
+            self.data["play_history"][rec["user"]] = set(rec["games"])
+
+    def _open_journal(self):
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(
+            os, "O_BINARY", 0)
+        return os.open(self.journal_path, flags, 0o644)
+
+    def _log(self, rec):
+        # 呼叫端需持有該資源的寫鎖；小筆 O_APPEND 寫入在 POSIX 上是原子的
+        with self._log_lock:
+            self._seq += 1
+            rec["seq"] = self._seq
+            line = _dumps_line(rec)
+            os.write(self._journal_fd, line)
+            self._journal.append((self._seq, line))
+        self.dirty.set()
+
+    @contextmanager
+    def _read_all(self):
+        # 依固定順序取得所有讀鎖，拿到一致的快照
+        with ExitStack() as stack:
+            for lock in self._locks:
+                stack.enter_context(lock.read())
+            yield
+
     def record_play(self, user_ids, game_name):
-        with self.lock:
+        with self.players_lock.read(), self.history_lock.write():
             for uid in user_ids:
                 # 找出 username
-                target = next(
-                    (p for p in self.data["players"] if p["id"] == uid), None)
+                target = self._players_by_id.get(uid)
                 if target:
                     uname = target["username"]
-                    if uname not in self.data["play_history"]:
-                        self.data["play_history"][uname] = []
+                    played = self.data["play_history"].setdefault(
+                        uname, set())
 
-                    if game_name not in self.data["play_history"][uname]:
-                        self.data["play_history"][uname].append(game_name)
+                    if game_name not in played:
+                        played.add(game_name)
+                        self._log({"op": "history", "user": uname,
+                                   "games": played})
                         print(f"[History] Recorded {uname} played {game_name}")
-            self.save()
             return {"status": "success"}
 
     def save(self):
-        with open(self.db_path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        _write_atomic(self.db_path, self._encode_db(self.data))
+
+    def _encode_db(self, obj):
+        if not self.pretty:
+            return _encode(obj)
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default,
+                                option=orjson.OPT_INDENT_2)
+        return json.dumps(obj, ensure_ascii=False, indent=2,
+                          default=_default).encode("utf-8")
+
+    def _flush_loop(self):
+        while not self.stop.wait(FLUSH_INTERVAL):
+            if not self.dirty.is_set():
+                continue
+            if (len(self._journal) >= SNAPSHOT_EVERY or
+                    time.time() - self._last_snapshot >= SNAPSHOT_INTERVAL):
+                self._flush()
+
+    def _flush(self):
+        # 先清 dirty 再序列化，期間的新修改會留到下一輪寫入
+        with self._read_all():
+            self.dirty.clear()
+            seq = self._seq
+            body = self._encode_db(dict(self.data, journal_seq=seq))
+        _write_atomic(self.db_path, body)
+        self._last_snapshot = time.time()
+
+        # 快照已涵蓋 seq 之前的紀錄，日誌只保留之後新增的部分
+        with self._log_lock:
+            self._journal = [(n, line) for n, line in self._journal if n > seq]
+            os.close(self._journal_fd)
+            _write_atomic(self.journal_path,
+                          b"".join(line for _, line in self._journal))
+            self._journal_fd = self._open_journal()
+
+    def close(self):
+        self.stop.set()
+        self._flusher.join()
+        if self.dirty.is_set():
+            self._flush()
+        os.close(self._journal_fd)
+
+    @contextmanager
+    def _auth_lock(self, username):
+        # 同名的 player/developer 落在同一個分片
+        shard = self._auth_locks[hash(username) & (N_AUTH_SHARDS - 1)]
+        with self.players_lock.read(), shard.write():
+            yield
 
     def _get_collection(self, role):
         if role == "developer":
-            return self.data["developers"], "developer"
-        return self.data["players"], "player"
+            return self.data["developers"], "developer", self._devs_by_username
+        return self.data["players"], "player", self._players_by_username
 
     # --- Auth ---
     def register(self, username, password, role="player"):
-        with self.lock:
-            collection, kind = self._get_collection(role)
-            for u in collection:
-                if u["username"] == username:
-                    return {"status": "error", "message": "Account already exists"}
-
-            uid = self.data["nexts"][kind]
-            self.data["nexts"][kind] += 1
+        hashed = _hash_password(password)  # 在鎖外算雜湊
+        with self._auth_lock(username):
+            collection, kind, by_name = self._get_collection(role)
+            if username in by_name:
+                return {"status": "error", "message": "Account already exists"}
+
+            with self._id_lock:
+                uid = self.data["nexts"][kind]
+                self.data["nexts"][kind] += 1
             new_user = {
-                "id": uid, "username": username, "password": password,
+                "id": uid, "username": username, "password": hashed,
                 "token": None, "online": False, "created_at": time.time()
             }
             collection.append(new_user)
-            self.save()
+            by_name[username] = new_user
+            if kind == "player":
+                self._players_by_id[uid] = new_user
+            self._log({"op": "put", "coll": kind + "s", "row": new_user})
             print(f"[Auth] Registered {role}: {username} (ID: {uid})")
             return {"status": "success", "data": {"id": uid, "username": username}}
 
     def login(self, username, password, role="player"):
-        with self.lock:
-            collection, _ = self._get_collection(role)
-            target = None
-            for u in collection:
-                if u["username"] == username:
-                    target = u
-                    break
-
+        hashed = _hash_password(password)
+        with self._auth_lock(username):
+            _, kind, by_name = self._get_collection(role)
+            target = by_name.get(username)
             if not target:
                 return {"status": "error", "message": "Account does not exist"}
-            if target["password"] != password:
+            if not _check_password(target["password"], password, hashed):
                 return {"status": "error", "message": "Wrong password"}
 
+            target["password"] = hashed
             new_token = str(uuid.uuid4())
             target["token"] = new_token
             target["online"] = True
-            self.save()
+            if kind == "player":
+                self._online_ids.add(target["id"])
+            self._log({"op": "put", "coll": kind + "s", "row": target})
+            self._invalidate("list_online")
             print(f"[Auth] {role} {username} logged in.")
             return {"status": "success", "data": {"id": target["id"], "username": target["username"], "token": new_token}}
 
     def logout(self, username, role="player"):
-        with self.lock:
-            collection, _ = self._get_collection(role)
-            for u in collection:
-                if u["username"] == username:
-                    u["online"] = False
-                    self.save()
-                    print(f"[Auth] {role} {username} logged out.")
-                    return {"status": "success", "message": "Logged out"}
+        with self._auth_lock(username):
+            _, kind, by_name = self._get_collection(role)
+            u = by_name.get(username)
+            if u:
+                u["online"] = False
+                if kind == "player":
+                    self._online_ids.discard(u["id"])
+                self._log({"op": "put", "coll": kind + "s", "row": u})
+                self._invalidate("list_online")
+                print(f"[Auth] {role} {username} logged out.")
+                return {"status": "success", "message": "Logged out"}
             return {"status": "error", "message": "User not found"}
 
     def user_list_online(self):
-        return [{"id": u["id"], "username": u["username"]} for u in self.data["players"] if u.get("online")]
+        with self.players_lock.read():
+            by_id = self._players_by_id
+            return [{"id": i, "username": by_id[i]["username"]}
+                    for i in sorted(self._online_ids)]
 
     # --- 遊戲管理 ---
     def game_upsert(self, meta, file_path):
-        with self.lock:
+        with self.games_lock.write():
             name = meta.get("game_name")
-            target = next(
-                (g for g in self.data["games"] if g["name"] == name), None)
+            target = self._games_by_name.get(name)
 
             # [修正 D2] 檢查作者權限
             if target:
@@ -178,6 +561,7 @@ class SimpleStorage:
             else:
                 target = {"name": name, "created_at": time.time()}
                 self.data["games"].append(target)
+                self._games_by_name[name] = target
 
             target["author"] = meta.get("author", "unknown")
             target["version"] = meta.get("version")
@@ -186,40 +570,51 @@ class SimpleStorage:
             target["execution"] = meta.get("execution", {})
             target["min_players"] = meta.get("min_players", 2)
             target["max_players"] = meta.get("max_players", 2)
-            self.save()
+            self._log({"op": "put", "coll": "games", "row": target})
+            self._game_list_view = None
+            self._invalidate("game_list")
             print(
                 f"[Storage] Game saved: {name} v{target['version']} by {target['author']}")
             return {"status": "success", "data": target}
 
     def game_delete(self, name, author):
-        with self.lock:
-            target = next(
-                (g for g in self.data["games"] if g["name"] == name), None)
+        with self.games_lock.write():
+            target = self._games_by_name.get(name)
             if not target:
                 return {"status": "error", "message": "Game not found"}
             if target.get("author") != author:
                 return {"status": "error", "message": "Permission denied"}
 
             self.data["games"].remove(target)
-            self.save()
+            del self._games_by_name[name]
+            self._log({"op": "del", "coll": "games", "key": name})
+            self._game_list_view = None
+            self._invalidate("game_list")
             print(f"[Storage] Game deleted: {name} by {author}")
             return {"status": "success", "message": "Game deleted"}
 
     def game_list(self):
-        return [{"name": g["name"], "version": g["version"], "author": g.get("author"), "description": g.get("description")} for g in self.data["games"]]
+        # 回傳共用的 list，呼叫端不可修改
+        with self.games_lock.read():
+            view = self._game_list_view
+            if view is None:
+                view = self._game_list_view = [{"name": g["name"], "version": g["version"], "author": g.get("author"), "description": g.get("description")} for g in self.data["games"]]
+            return view
 
     def game_get(self, name):
-        return next((g for g in self.data["games"] if g["name"] == name), None)
+        with self.games_lock.read():
+            return self._games_by_name.get(name)
 
     # --- [新增 P4] 評論系統 ---
     def review_add(self, game_name, username, rating, comment):
-        with self.lock:
+        with self.games_lock.read(), self.reviews_lock.write(), \
+                self.history_lock.read():
             # 1. 確認遊戲存在
-            if not any(g["name"] == game_name for g in self.data["games"]):
+            if game_name not in self._games_by_name:
                 return {"status": "error", "message": "Game not found"}
 
             # 2. [新增] 確認是否有遊玩紀錄
-            history = self.data["play_history"].get(username, [])
+            history = self.data["play_history"].get(username, ())
             if game_name not in history:
                 return {"status": "error", "message": "You must play this game before reviewing."}
 
@@ -235,29 +630,28 @@ class SimpleStorage:
                 "created_at": time.time()
             }
             self.data["reviews"].append(new_review)
-            self.save()
+            self._log({"op": "review", "row": new_review})
+            self._invalidate(("review_list", game_name))
             print(f"[Review] {username} reviewed {game_name}: {rating}")
             return {"status": "success", "message": "Review added"}
 
     def review_list(self, game_name):
         # 篩選該遊戲的評論
-        targets = [r for r in self.data["reviews"]
-                   if r["game_name"] == game_name]
+        with self.reviews_lock.read():
+            targets = [r for r in self.data["reviews"]
+                       if r["game_name"] == game_name]
         return targets
 
     # --- 房間相關 ---
     # db_server.py 的 room_create 函式
     # db_server.py 的 room_create 函式
     def room_create(self, d):
-        with self.lock:
+        with self.players_lock.read(), self.rooms_lock.write():
             rid = self.data["nexts"]["room"]
             self.data["nexts"]["room"] += 1
             host_id = d.get("hostUserId") or d.get("user_id")
-            host_name = str(host_id)
-            for p in self.data["players"]:
-                if p["id"] == host_id:
-                    host_name = p["username"]
-                    break
+            host = self._players_by_id.get(host_id)
+            host_name = host["username"] if host else str(host_id)
 
             # [新增] 讀取 max_players，預設為 2
             max_players = d.get("max_players", 2)
@@ -272,135 +666,584 @@ class SimpleStorage:
                 "max_players": max_players  # 儲存人數上限
             }
             self.data["rooms"].append(r)
-            self.save()
+            self._rooms_by_id[rid] = r
+            self._log({"op": "put", "coll": "rooms", "row": r})
+            self._invalidate("list_public")
             return r
-        
+
     def room_list_public(self):
-        return self.data["rooms"]
+        with self.rooms_lock.read():
+            return list(self.data["rooms"])
 
     def _get_room(self, rid):
-        return next((r for r in self.data["rooms"] if r["id"] == rid), None)
+        return self._rooms_by_id.get(rid)
 
     def room_accept(self, d):
-        with self.lock:
+        with self.rooms_lock.write():
             rid = d.get("roomId") or d.get("room_id")
             uid = d.get("userId") or d.get("user_id")
             r = self._get_room(rid)
             if r:
                 if uid not in r["users"]:
                     r["users"].append(uid)
-                self.save()
+                self._log({"op": "put", "coll": "rooms", "row": r})
+                self._invalidate("list_public")
                 return r
             return None
 
     def room_leave(self, d):
-        with self.lock:
+        with self.rooms_lock.write():
             rid = d.get("roomId") or d.get("room_id")
             uid = d.get("userId") or d.get("user_id")
             r = self._get_room(rid)
             if r and uid in r["users"]:
                 r["users"].remove(uid)
-                self.save()
+                self._log({"op": "put", "coll": "rooms", "row": r})
+                self._invalidate("list_public")
                 return r
             return None
 
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password TEXT,
+    token TEXT, online INTEGER NOT NULL DEFAULT 0, created_at REAL);
+CREATE TABLE IF NOT EXISTS developers (
+    id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password TEXT,
+    token TEXT, online INTEGER NOT NULL DEFAULT 0, created_at REAL);
+CREATE TABLE IF NOT EXISTS games (
+    name TEXT PRIMARY KEY, author TEXT, version TEXT, description TEXT,
+    file_path TEXT, execution TEXT, min_players INTEGER,
+    max_players INTEGER, created_at REAL);
+CREATE TABLE IF NOT EXISTS rooms (
+    id INTEGER PRIMARY KEY, name TEXT, host_user_id INTEGER,
+    host_name TEXT, status TEXT, users TEXT, max_players INTEGER);
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY, game_name TEXT, username TEXT, rating INTEGER,
+    comment TEXT, created_at REAL);
+CREATE INDEX IF NOT EXISTS reviews_game ON reviews (game_name);
+CREATE TABLE IF NOT EXISTS play_history (
+    username TEXT, game_name TEXT, PRIMARY KEY (username, game_name)
+) WITHOUT ROWID;
+"""
+
+_GAME_COLS = ("name", "author", "version", "description", "file_path",
+              "execution", "min_players", "max_players", "created_at")
+_ROOM_COLS = ("id", "name", "host_user_id", "host_name", "status", "users",
+              "max_players")
+
+
+class SqliteStorage(ResponseCache):
+    """以 SQLite (WAL) 存放資料，介面與 SimpleStorage 相同。
+    每條執行緒各用一條連線，讀者可同時進行；寫入由 SQLite 自行排隊"""
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        db = self._db()
+        # user_version = 0 代表剛建立的檔案，只在這時匯入一次舊的 JSON
+        if db.execute("PRAGMA user_version").fetchone()[0] == 0:
+            db.executescript(SCHEMA)
+            self._import_json()
+            db.execute("PRAGMA user_version = 1")
+        # === 強制重置所有玩家為離線 ===
+        db.execute("UPDATE players SET online = 0")
+        print(f"[Storage] Opened SQLite DB {self.db_path} "
+              "(All users reset to offline)")
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False,
+                                 isolation_level=None, timeout=5.0)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            with self._conns_lock:
+                self._conns.append(db)
+        return db
+
+    @contextmanager
+    def _tx(self):
+        # BEGIN IMMEDIATE: 一開始就拿寫鎖，避免讀了再升級時失敗
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _import_json(self):
+        # 第一次啟動時，把同名的 .json 快照匯入 (若存在)
+        src = os.path.splitext(self.db_path)[0] + ".json"
+        if not os.path.exists(src):
+            return
+        try:
+            with open(src, "rb") as f:
+                old = _decode(f.read())
+        except Exception as e:
+            print(f"[Storage] Import error: {e}, using empty DB")
+            return
+        with self._tx() as db:
+            for coll in ("players", "developers"):
+                db.executemany(
+                    f"INSERT OR IGNORE INTO {coll} VALUES (?, ?, ?, ?, 0, ?)",
+                    [(u["id"], u["username"], u.get("password"),
+                      u.get("token"), u.get("created_at"))
+                     for u in old.get(coll, [])])
+            db.executemany(
+                "INSERT OR IGNORE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._game_row(g) for g in old.get("games", [])])
+            db.executemany(
+                "INSERT OR IGNORE INTO rooms VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._room_row(r) for r in old.get("rooms", [])])
+            db.executemany(
+                "INSERT INTO reviews (game_name, username, rating, comment, "
+                "created_at) VALUES (?, ?, ?, ?, ?)",
+                [(r["game_name"], r["username"], r["rating"], r["comment"],
+                  r.get("created_at")) for r in old.get("reviews", [])])
+            history = old.get("play_history")
+            if isinstance(history, dict):
+                db.executemany(
+                    "INSERT OR IGNORE INTO play_history VALUES (?, ?)",
+                    [(u, g) for u, games in history.items() for g in games])
+        print(f"[Storage] Imported {src} into {self.db_path}")
+
+    def close(self):
+        with self._conns_lock:
+            for db in self._conns:
+                db.close()
+            self._conns.clear()
+
+    # --- 列 <-> dict 轉換 ---
+    @staticmethod
+    def _game_row(g):
+        return (g["name"], g.get("author"), g.get("version"),
+                g.get("description", ""), g.get("file_path"),
+                _encode(g.get("execution", {})).decode("utf-8"),
+                g.get("min_players", 2), g.get("max_players", 2),
+                g.get("created_at"))
+
+    @staticmethod
+    def _game_dict(row):
+        g = dict(row)
+        g["execution"] = _decode(g["execution"] or "{}")
+        return g
+
+    @staticmethod
+    def _room_row(r):
+        return (r["id"], r.get("name"), r.get("host_user_id"),
+                r.get("host_name"), r.get("status", "idle"),
+                _encode(r.get("users", [])).decode("utf-8"),
+                r.get("max_players", 2))
+
+    @staticmethod
+    def _room_dict(row):
+        r = dict(row)
+        r["users"] = _decode(r["users"])
+        return r
+
+    def _put_room(self, db, r):
+        db.execute("UPDATE rooms SET users = ? WHERE id = ?",
+                   (_encode(r["users"]).decode("utf-8"), r["id"]))
+
+    @staticmethod
+    def _table(role):
+        return "developers" if role == "developer" else "players"
+
+    # --- Auth ---
+    def register(self, username, password, role="player"):
+        table = self._table(role)
+        hashed = _hash_password(password)
+        try:
+            with self._tx() as db:
+                uid = db.execute(
+                    f"INSERT INTO {table} (username, password, token, online,"
+                    " created_at) VALUES (?, ?, NULL, 0, ?)",
+                    (username, hashed, time.time())).lastrowid
+        except sqlite3.IntegrityError:
+            return {"status": "error", "message": "Account already exists"}
+        print(f"[Auth] Registered {role}: {username} (ID: {uid})")
+        return {"status": "success", "data": {"id": uid, "username": username}}
+
+    def login(self, username, password, role="player"):
+        table = self._table(role)
+        hashed = _hash_password(password)
+        with self._tx() as db:
+            row = db.execute(
+                f"SELECT id, password FROM {table} WHERE username = ?",
+                (username,)).fetchone()
+            if not row:
+                return {"status": "error", "message": "Account does not exist"}
+            if not _check_password(row["password"], password, hashed):
+                return {"status": "error", "message": "Wrong password"}
+            new_token = str(uuid.uuid4())
+            db.execute(f"UPDATE {table} SET token = ?, online = 1,"
+                       " password = ? WHERE id = ?",
+                       (new_token, hashed, row["id"]))
+        self._invalidate("list_online")
+        print(f"[Auth] {role} {username} logged in.")
+        return {"status": "success", "data": {"id": row["id"], "username": username, "token": new_token}}
+
+    def logout(self, username, role="player"):
+        table = self._table(role)
+        with self._tx() as db:
+            n = db.execute(f"UPDATE {table} SET online = 0 WHERE username = ?",
+                           (username,)).rowcount
+        if n:
+            self._invalidate("list_online")
+            print(f"[Auth] {role} {username} logged out.")
+            return {"status": "success", "message": "Logged out"}
+        return {"status": "error", "message": "User not found"}
+
+    def user_list_online(self):
+        rows = self._db().execute(
+            "SELECT id, username FROM players WHERE online = 1 ORDER BY id")
+        return [dict(r) for r in rows]
+
+    def record_play(self, user_ids, game_name):
+        with self._tx() as db:
+            for uid in user_ids:
+                row = db.execute("SELECT username FROM players WHERE id = ?",
+                                 (uid,)).fetchone()
+                if row and db.execute(
+                        "INSERT OR IGNORE INTO play_history VALUES (?, ?)",
+                        (row["username"], game_name)).rowcount:
+                    print(f"[History] Recorded {row['username']} played {game_name}")
+        return {"status": "success"}
+
+    # --- 遊戲管理 ---
+    def game_upsert(self, meta, file_path):
+        name = meta.get("game_name")
+        with self._tx() as db:
+            row = db.execute("SELECT author, created_at FROM games "
+                             "WHERE name = ?", (name,)).fetchone()
+            # [修正 D2] 檢查作者權限
+            if row and row["author"] != meta.get("author"):
+                print(
+                    f"[Storage] Permission denied: {meta.get('author')} tried to overwrite {name}")
+                return {"status": "error", "message": "Permission denied: You are not the author."}
+            target = {
+                "name": name,
+                "created_at": row["created_at"] if row else time.time(),
+                "author": meta.get("author", "unknown"),
+                "version": meta.get("version"),
+                "description": meta.get("description", ""),
+                "file_path": file_path,
+                "execution": meta.get("execution", {}),
+                "min_players": meta.get("min_players", 2),
+                "max_players": meta.get("max_players", 2),
+            }
+            # UPSERT 保留原本的 rowid (INSERT OR REPLACE 會刪掉重插)，
+            # 更新過的遊戲在 game_list 裡維持原位，跟 JSON 版一致
+            db.execute("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                       "ON CONFLICT(name) DO UPDATE SET " + ", ".join(
+                           f"{c} = excluded.{c}" for c in _GAME_COLS[1:]),
+                       self._game_row(target))
+        self._invalidate("game_list")
+        print(
+            f"[Storage] Game saved: {name} v{target['version']} by {target['author']}")
+        return {"status": "success", "data": target}
+
+    def game_delete(self, name, author):
+        with self._tx() as db:
+            row = db.execute("SELECT author FROM games WHERE name = ?",
+                             (name,)).fetchone()
+            if not row:
+                return {"status": "error", "message": "Game not found"}
+            if row["author"] != author:
+                return {"status": "error", "message": "Permission denied"}
+            db.execute("DELETE FROM games WHERE name = ?", (name,))
+        self._invalidate("game_list")
+        print(f"[Storage] Game deleted: {name} by {author}")
+        return {"status": "success", "message": "Game deleted"}
+
+    def game_list(self):
+        rows = self._db().execute(
+            "SELECT name, version, author, description FROM games "
+            "ORDER BY rowid")
+        return [dict(r) for r in rows]
+
+    def game_get(self, name):
+        row = self._db().execute(
+            f"SELECT {', '.join(_GAME_COLS)} FROM games WHERE name = ?",
+            (name,)).fetchone()
+        return self._game_dict(row) if row else None
+
+    # --- 評論系統 ---
+    def review_add(self, game_name, username, rating, comment):
+        with self._tx() as db:
+            # 1. 確認遊戲存在
+            if not db.execute("SELECT 1 FROM games WHERE name = ?",
+                              (game_name,)).fetchone():
+                return {"status": "error", "message": "Game not found"}
+
+            # 2. 確認是否有遊玩紀錄
+            if not db.execute("SELECT 1 FROM play_history WHERE username = ?"
+                              " AND game_name = ?",
+                              (username, game_name)).fetchone():
+                return {"status": "error", "message": "You must play this game before reviewing."}
+
+            # 3. 檢查評分範圍
+            if not (1 <= rating <= 5):
+                return {"status": "error", "message": "Rating must be 1-5"}
+
+            db.execute("INSERT INTO reviews (game_name, username, rating, "
+                       "comment, created_at) VALUES (?, ?, ?, ?, ?)",
+                       (game_name, username, rating, comment[:200],
+                        time.time()))
+        self._invalidate(("review_list", game_name))
+        print(f"[Review] {username} reviewed {game_name}: {rating}")
+        return {"status": "success", "message": "Review added"}
+
+    def review_list(self, game_name):
+        rows = self._db().execute(
+            "SELECT game_name, username, rating, comment, created_at "
+            "FROM reviews WHERE game_name = ? ORDER BY id", (game_name,))
+        return [dict(r) for r in rows]
+
+    # --- 房間相關 ---
+    def room_create(self, d):
+        host_id = d.get("hostUserId") or d.get("user_id")
+        with self._tx() as db:
+            host = db.execute("SELECT username FROM players WHERE id = ?",
+                              (host_id,)).fetchone()
+            r = {
+                "id": None,
+                "name": d.get("name"),
+                "host_user_id": host_id,
+                "host_name": host["username"] if host else str(host_id),
+                "status": "idle",
+                "users": [host_id],
+                "max_players": d.get("max_players", 2)  # 儲存人數上限
+            }
+            r["id"] = db.execute(
+                "INSERT INTO rooms VALUES (NULL, ?, ?, ?, ?, ?, ?)",
+                self._room_row(r)[1:]).lastrowid
+        self._invalidate("list_public")
+        return r
+
+    def room_list_public(self):
+        rows = self._db().execute(
+            f"SELECT {', '.join(_ROOM_COLS)} FROM rooms ORDER BY id")
+        return [self._room_dict(r) for r in rows]
+
+    def _get_room(self, db, rid):
+        row = db.execute(f"SELECT {', '.join(_ROOM_COLS)} FROM rooms "
+                         "WHERE id = ?", (rid,)).fetchone()
+        return self._room_dict(row) if row else None
+
+    def room_accept(self, d):
+        rid = d.get("roomId") or d.get("room_id")
+        uid = d.get("userId") or d.get("user_id")
+        with self._tx() as db:
+            r = self._get_room(db, rid)
+            if not r:
+                return None
+            if uid not in r["users"]:
+                r["users"].append(uid)
+                self._put_room(db, r)
+        self._invalidate("list_public")
+        return r
+
+    def room_leave(self, d):
+        rid = d.get("roomId") or d.get("room_id")
+        uid = d.get("userId") or d.get("user_id")
+        with self._tx() as db:
+            r = self._get_room(db, rid)
+            if not r or uid not in r["users"]:
+                return None
+            r["users"].remove(uid)
+            self._put_room(db, r)
+        self._invalidate("list_public")
+        return r
+
+
+def _ok(out):
+    return _encode_ok(out)  # 已序列化的 bytes，handle_client 直接送出
+
+
+def _game_get(s, d):
+    out = s.game_get(d.get("name"))
+    return _ok(out) if out else {"status": "error", "message": "Not found"}
+
+
+def _review_list(s, d):
+    name = d.get("game_name")
+    return s.cached_response(("review_list", name),
+                             lambda: s.review_list(name))
+
+
+# action -> fn(storage, data)；回傳 dict，或已序列化好的快取回應 (bytes)
+ACTIONS = {
+    "record_play": lambda s, d: s.record_play(
+        d.get("user_ids"), d.get("game_name")),
+    "auth_register": lambda s, d: s.register(
+        d.get("username"), d.get("password"), d.get("role", "player")),
+    "auth_login": lambda s, d: s.login(
+        d.get("username"), d.get("password"), d.get("role", "player")),
+    "logout": lambda s, d: s.logout(
+        d.get("username"), d.get("role", "player")),
+    "game_upsert": lambda s, d: s.game_upsert(
+        d.get("meta"), d.get("file_path")),
+    "game_list": lambda s, d: s.cached_response("game_list", s.game_list),
+    "game_get": _game_get,
+    "game_delete": lambda s, d: s.game_delete(
+        d.get("game_name"), d.get("author")),
+    "review_add": lambda s, d: s.review_add(
+        d.get("game_name"), d.get("username"),
+        d.get("rating"), d.get("comment")),
+    "review_list": _review_list,
+    "create_room": lambda s, d: _ok(s.room_create(d)),
+    "list_public": lambda s, d: s.cached_response(
+        "list_public", s.room_list_public),
+    "accept": lambda s, d: _ok(s.room_accept(d)),
+    "leave": lambda s, d: _ok(s.room_leave(d)),
+    "list_online": lambda s, d: s.cached_response(
+        "list_online", s.user_list_online),
+}
+
+
+_open_conns = set()  # 還連著的 client，關機時一起中斷
+_open_conns_lock = threading.Lock()
+
+
 def handle_client(conn, addr, storage):
+    with _open_conns_lock:
+        _open_conns.add(conn)
     try:
-        req = recv_message(conn)
-        act = req.get("action")
-        data = req.get("data") or {}
-        resp = None
-
-        # ... (Auth & Game & Review & Room 路由保持不變) ...
-        # 請在原本的 if/elif 結構中加入這條：
-
-        if act == "record_play":  # [新增路由]
-            resp = storage.record_play(
-                data.get("user_ids"), data.get("game_name"))
-
-        # --- 以下是原本的路由 (為了完整性列出上下文，請將這段融合進去) ---
-        elif act == "auth_register":
-            resp = storage.register(data.get("username"), data.get(
-                "password"), data.get("role", "player"))
-        elif act == "auth_login":
-            resp = storage.login(data.get("username"), data.get(
-                "password"), data.get("role", "player"))
-        elif act == "logout":
-            resp = storage.logout(data.get("username"),
-                                  data.get("role", "player"))
-        elif act == "game_upsert":
-            resp = storage.game_upsert(data.get("meta"), data.get("file_path"))
-        elif act == "game_list":
-            out = storage.game_list()
-            resp = {"status": "success", "data": out}
-        elif act == "game_get":
-            out = storage.game_get(data.get("name"))
-            resp = {"status": "success", "data": out} if out else {
-                "status": "error", "message": "Not found"}
-        elif act == "game_delete":
-            resp = storage.game_delete(
-                data.get("game_name"), data.get("author"))
-        elif act == "review_add":
-            resp = storage.review_add(data.get("game_name"), data.get(
-                "username"), data.get("rating"), data.get("comment"))
-        elif act == "review_list":
-            out = storage.review_list(data.get("game_name"))
-            resp = {"status": "success", "data": out}
-        elif act == "create_room":
-            out = storage.room_create(data)
-            resp = {"status": "success", "data": out}
-        elif act == "list_public":
-            out = storage.room_list_public()
-            resp = {"status": "success", "data": out}
-        elif act == "accept":
-            out = storage.room_accept(data)
-            resp = {"status": "success", "data": out}
-        elif act == "leave":
-            out = storage.room_leave(data)
-            resp = {"status": "success", "data": out}
-        elif act == "list_online":
-            out = storage.user_list_online()
-            resp = {"status": "success", "data": out}
-
-        if resp is None:
-            resp = {"status": "error", "message": f"Unknown action: {act}"}
-        send_message(conn, resp)
+        # 請求/回應都是小封包，關掉 Nagle 避免回應被延遲 (UNIX socket 沒有 Nagle)
+        if conn.family != getattr(socket, "AF_UNIX", None):
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(IDLE_TIMEOUT)
+        # 同一條連線可連續送多個請求 (lobby 的連線池會重複使用)
+        while True:
+            req = recv_message(conn, REQ_MAX_LEN)
+            if not isinstance(req, dict):
+                raise ValueError("Bad request")
+            act = req.get("action")
+
+            # 查表分派，取代原本一長串 if/elif；先確認 action 再碰 data
+            fn = ACTIONS.get(act)
+            if fn is None:
+                resp = {"status": "error", "message": f"Unknown action: {act}"}
+            else:
+                data = req.get("data") or {}
+                if not isinstance(data, dict):
+                    raise ValueError("Bad request data")
+                resp = fn(storage, data)
+
+            if isinstance(resp, bytes):
+                send_raw(conn, resp)
+            else:
+                send_message(conn, resp)
 
+    except (ConnectionError, TimeoutError):
+        pass  # 對方斷線 (含 BrokenPipeError) 或閒置逾時，屬於正常情況，不記錄
     except Exception as e:
-        print(f"[DB] Error: {e}")
+        if isinstance(e, ValueError):  # 格式錯誤的請求，不必印 traceback
+            log.warning("bad request from %s: %s", addr, e)
+        else:
+            log.exception("request from %s failed", addr)
         try:
             send_message(conn, {"status": "error", "message": str(e)})
-        except:
+        except OSError:
             pass
     finally:
+        with _open_conns_lock:
+            _open_conns.discard(conn)
         conn.close()
 
+
+def unix_socket_path(port):
+    # 依 port 區分，同一台機器上跑多個 DB 時不會連錯
+    return f"/tmp/np_db.{port}.sock"
+
+
+def _accept_loop(srv, pool, storage):
+    while True:
+        try:
+            conn, addr = srv.accept()
+        except OSError:
+            return  # 主程式關閉了 listening socket
+        pool.submit(handle_client, conn, addr, storage)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=10001)
     parser.add_argument("--db", default="db_clean.json")
+    parser.add_argument("--pretty", action="store_true",
+                        help="write the DB snapshot with indentation")
+    parser.add_argument("--backend", choices=("json", "sqlite"),
+                        default="json",
+                        help="json: snapshot + journal; sqlite: SQLite WAL "
+                             "file next to --db (imports the JSON once)")
+    parser.add_argument("--unix", nargs="?", const="", default=None,
+                        metavar="PATH",
+                        help="also listen on a UNIX socket for same-host "
+                             "clients (default path: /tmp/np_db.<port>.sock)")
     args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING,
+                        format="[DB] %(levelname)s %(message)s")
 
-    storage = SimpleStorage(args.db)
+    if args.backend == "sqlite":
+        storage = SqliteStorage(os.path.splitext(args.db)[0] + ".sqlite3")
+    else:
+        storage = SimpleStorage(args.db, pretty=args.pretty)
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     srv.bind(("0.0.0.0", args.port))
-    srv.listen(5)
+    srv.listen(128)
     print(
         f"[DB] Listening on port {args.port} (Full Features) - Press Ctrl+C to stop")
 
+    # 固定大小的執行緒池，不再每個連線開一條新執行緒
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                              thread_name_prefix="db")
+
+    # 同機的 lobby 走 UNIX socket，省掉 loopback TCP 的負擔
+    usrv = unix_path = None
+    if args.unix is not None and hasattr(socket, "AF_UNIX"):
+        unix_path = args.unix or unix_socket_path(args.port)
+        if os.path.exists(unix_path):
+            os.remove(unix_path)  # 上次沒清掉的 socket 檔
+        usrv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        usrv.bind(unix_path)
+        usrv.listen(128)
+        threading.Thread(target=_accept_loop, args=(usrv, pool, storage),
+                         daemon=True).start()
+        print(f"[DB] Listening on {unix_path}")
     try:
         while True:
             conn, addr = srv.accept()
-            t = threading.Thread(target=handle_client,
-                                 args=(conn, addr, storage))
-            t.daemon = True
-            t.start()
+            pool.submit(handle_client, conn, addr, storage)
     except KeyboardInterrupt:
         print("\n[DB] Shutting down...")
     finally:
         srv.close()
+        if usrv is not None:
+            try:
+                usrv.shutdown(socket.SHUT_RDWR)  # 叫醒 _accept_loop
+            except OSError:
+                pass
+            usrv.close()
+            os.remove(unix_path)
+        # 叫醒還在等下一個請求的持久連線，worker 才能結束
+        with _open_conns_lock:
+            for c in _open_conns:
+                try:
+                    c.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        pool.shutdown(wait=False, cancel_futures=True)
+        storage.close()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,121 @@
 # developer_client.py
 import socket
+import hashlib
 import json
 import os
-import zipfile
-import io
+import select
+import struct
+import time
+import zlib
 import argparse
 import sys
-from utils.protocol import send_message, recv_message, send_file
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.protocol import send_message, recv_message, send_fileobj, ChunkedWriter
+
+
+_SKIP_DIRS = ('.git', '__pycache__', 'venv', '.venv')
+
+
+def _walk(base):
+    # os.scandir 的 DirEntry 直接帶檔案類型，不必每個檔案再 stat 一次
+    for e in os.scandir(base):
+        if e.is_dir(follow_symlinks=False):
+            if e.name not in _SKIP_DIRS:
+                yield from _walk(e.path)
+        elif e.is_file() and e.name != '.DS_Store':
+            yield e.path
+
+
+def _manifest_hash(base):
+    # 依路徑排序，對每個檔案的 (路徑, 大小, mtime) 做 BLAKE2b；
+    # 檔案沒動過雜湊就不變，不必讀檔內容。
+    # game_config.json 每次升版都會被改寫，改用去掉 version 的內容，
+    # 只升版號時雜湊不變
+    base = os.path.normpath(base)
+    base_len = len(base) + 1
+    h = hashlib.blake2b(digest_size=16)
+    for file_path in sorted(_walk(base)):
+        name = file_path[base_len:].replace(os.sep, '/')
+        if name == 'game_config.json':
+            with open(file_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            config.get('meta', {}).pop('version', None)
+            h.update(b'game_config.json\0' + json.dumps(
+                config, sort_keys=True).encode('utf-8') + b'\n')
+            continue
+        st = os.stat(file_path)
+        h.update(f"{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode(
+            'utf-8', 'surrogateescape'))
+    return h.hexdigest()
+
+
+_ZIP_WORKERS = min(8, os.cpu_count() or 1)
+_LOCAL_HDR = struct.Struct('<4s2B4HL2L2H')
+_CENTRAL_HDR = struct.Struct('<4s4B4HL2L5H2L')
+_END_HDR = struct.Struct('<4s4H2LH')
+_DEFLATED = 8  # zip 的 deflate 壓縮方式代號
+
+
+def _deflate_file(path):
+    # 在 worker 執行緒讀檔 + 壓縮 (zlib 壓縮時會釋放 GIL，多個檔案可以並行)
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    c = zlib.compressobj(1, zlib.DEFLATED, -15)  # level 1, zip 用的 raw deflate
+    comp = c.compress(data) + c.flush()
+    return comp, zlib.crc32(data), len(data), st.st_mtime, st.st_mode
+
+
+class _ZipWriter:
+    """把已壓縮好的檔案依序寫成 zip (不需要 seek，可直接寫進 ChunkedWriter)。
+    zipfile 沒有寫入預先壓縮資料的介面，所以自己寫 header；
+    不支援 zip64 (上傳本來就限制 512 MiB)"""
+
+    def __init__(self, out):
+        self.out = out
+        self.offset = 0
+        self.central = []
+
+    def add(self, name, comp, crc, size, mtime, mode):
+        name = name.replace(os.sep, '/').encode('utf-8')
+        flags = 0x800  # 檔名是 UTF-8
+        t = time.localtime(max(mtime, 315532800))  # zip 的時間從 1980 年起
+        dostime = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        dosdate = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        if len(comp) > 0xFFFFFFFF or size > 0xFFFFFFFF or \
+                self.offset > 0xFFFFFFFF or len(self.central) >= 0xFFFF:
+            raise ValueError("專案太大，無法打包")
+        self.out.write(_LOCAL_HDR.pack(
+            b'PK\x03\x04', 20, 0, flags, _DEFLATED, dostime, dosdate,
+            crc, len(comp), size, len(name), 0) + name)
+        self.out.write(comp)
+        self.central.append(_CENTRAL_HDR.pack(
+            b'PK\x01\x02', 20, 3, 20, 0, flags, _DEFLATED, dostime,
+            dosdate, crc, len(comp), size, len(name), 0, 0, 0, 0,
+            (mode & 0xFFFF) << 16, self.offset) + name)
+        self.offset += _LOCAL_HDR.size + len(name) + len(comp)
+
+    def close(self):
+        cd = b''.join(self.central)
+        self.out.write(cd)
+        self.out.write(_END_HDR.pack(
+            b'PK\x05\x06', 0, 0, len(self.central), len(self.central),
+            len(cd), self.offset, 0))
+
+
+# 斷線後可以放心重送的唯讀動作
+_READ_ONLY = frozenset(("game_list",))
+
+
+def _is_idle_alive(s):
+    # 閒置的連線上不該有資料可讀；可讀代表 server 已關閉連線
+    try:
+        readable, _, _ = select.select([s], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
 
 
 class DeveloperClient:
@@ -31,6 +140,34 @@ class DeveloperClient:
                 pass
             self.conn = None
 
+    def _rpc(self, action, data, stream=None):
+        # 整個 session 共用一條連線 (第一次用到才連)，不再每個動作重新握手
+        if self.conn is not None and not _is_idle_alive(self.conn):
+            self.close()  # server 已關閉連線 (例如重開)：送出前就先重連
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = self.connect()
+                if self.conn is None:
+                    return None
+            sent = False
+            try:
+                send_message(self.conn, {"action": action, "data": data})
+                if stream is not None:
+                    stream(self.conn)  # 緊接著請求送出資料 (例如上傳的 zip)
+                sent = True
+                resp = recv_message(self.conn)
+                if resp is None:
+                    raise ConnectionError("server 關閉了連線")
+                return resp
+            except (ConnectionError, OSError) as e:
+                self.close()
+                # 請求還沒送完 server 不會執行，或是唯讀的動作：重連一次再試；
+                # 送完才斷線的話 server 可能已經做了，不能重送
+                if attempt or (sent and action not in _READ_ONLY):
+                    print(f"[錯誤] 連線中斷: {e}" +
+                          ("，無法確認操作是否完成" if sent else ""))
+                    return None
+
     def _get_input(self, prompt):
         try:
             return input(prompt).strip()
@@ -45,42 +182,32 @@ class DeveloperClient:
         if not user or not pwd:
             return
 
-        conn = self.connect()
-        if not conn:
+        resp = self._rpc("auth_register", {
+            "username": user, "password": pwd, "role": "developer"})
+        if not resp:
             return
-        try:
-            send_message(conn, {"action": "auth_register", "data": {
-                         "username": user, "password": pwd, "role": "developer"}})
-            resp = recv_message(conn)
-            if resp["status"] == "success":
-                print(f"[成功] 註冊成功 ID: {resp['data']['id']}")
-            else:
-                print(f"[失敗] {resp.get('message')}")
-        finally:
-            conn.close()
+        if resp["status"] == "success":
+            print(f"[成功] 註冊成功 ID: {resp['data']['id']}")
+        else:
+            print(f"[失敗] {resp.get('message')}")
 
     def auth_login(self):
         print("\n=== 🔑 開發者登入 ===")
         user = self._get_input("帳號: ")
         pwd = self._get_input("密碼: ")
-        conn = self.connect()
-        if not conn:
+        resp = self._rpc("auth_login", {
+            "username": user, "password": pwd, "role": "developer"})
+        if not resp:
+            return False
+        if resp["status"] == "success":
+            data = resp["data"]
+            self.user_id = data["id"]
+            self.username = data["username"]
+            print(f"[成功] 歡迎回來, Dev {self.username}")
+            return True
+        else:
+            print(f"[失敗] {resp.get('message')}")
             return False
-        try:
-            send_message(conn, {"action": "auth_login", "data": {
-                         "username": user, "password": pwd, "role": "developer"}})
-            resp = recv_message(conn)
-            if resp["status"] == "success":
-                data = resp["data"]
-                self.user_id = data["id"]
-                self.username = data["username"]
-                print(f"[成功] 歡迎回來, Dev {self.username}")
-                return True
-            else:
-                print(f"[失敗] {resp.get('message')}")
-                return False
-        finally:
-            conn.close()
 
     def auth_loop(self):
         while True:
@@ -99,43 +226,45 @@ class DeveloperClient:
 
     # --- Features ---
     def list_my_games(self):
-        conn = self.connect()
-        if not conn:
+        resp = self._rpc("game_list", {})
+        if not resp:
             return
-        try:
-            send_message(conn, {"action": "game_list", "data": {}})
-            resp = recv_message(conn)
-            if resp["status"] == "success":
-                games = resp["data"]
-                print(f"\n=== 📦 上架遊戲列表 ===")
-                print(f"{'Name':<20} {'Ver':<10} {'Author'}")
-                print("-" * 40)
-                my_games = [g for g in games if g.get(
-                    "author") == self.username]
-                if not my_games:
-                    print("(您尚未上架任何遊戲)")
-                else:
-                    for g in my_games:
-                        print(
-                            f"{g['name']:<20} v{g['version']:<10} {g.get('author')}")
+        if resp["status"] == "success":
+            games = resp["data"]
+            print(f"\n=== 📦 上架遊戲列表 ===")
+            print(f"{'Name':<20} {'Ver':<10} {'Author'}")
+            print("-" * 40)
+            my_games = [g for g in games if g.get(
+                "author") == self.username]
+            if not my_games:
+                print("(您尚未上架任何遊戲)")
             else:
-                print(f"[失敗] {resp.get('message')}")
-        finally:
-            conn.close()
-
-    def zip_directory(self, path):
-        mem_file = io.BytesIO()
-        with zipfile.ZipFile(mem_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for root, dirs, files in os.walk(path):
-                dirs[:] = [d for d in dirs if d not in (
-                    '.git', '__pycache__', 'venv', '.venv')]
-                for file in files:
-                    if file == '.DS_Store':
-                        continue
-                    file_path = os.path.join(root, file)
-                    archive_name = os.path.relpath(file_path, path)
-                    zf.write(file_path, archive_name)
-        return mem_file.getvalue()
+                for g in my_games:
+                    print(
+                        f"{g['name']:<20} v{g['version']:<10} {g.get('author')}")
+        else:
+            print(f"[失敗] {resp.get('message')}")
+
+    def zip_directory(self, path, out):
+        # 直接寫進 out (例如 ChunkedWriter)，不在記憶體裡組整個 zip；
+        # deflate level 1 比預設的 6 快好幾倍，壓縮率只差一點。
+        # 各檔案由執行緒池並行壓縮，主執行緒依原本順序寫出；
+        # 最多只有 2 * _ZIP_WORKERS 個壓縮結果留在記憶體裡
+        base = os.path.normpath(path)
+        base_len = len(base) + 1  # 去掉 "base/" 前綴就是壓縮檔內的路徑
+        zw = _ZipWriter(out)
+        pending = deque()
+        with ThreadPoolExecutor(_ZIP_WORKERS) as pool:
+            for file_path in _walk(base):
+                pending.append((file_path[base_len:],
+                                pool.submit(_deflate_file, file_path)))
+                if len(pending) >= 2 * _ZIP_WORKERS:
+                    name, fut = pending.popleft()
+                    zw.add(name, *fut.result())
+            while pending:
+                name, fut = pending.popleft()
+                zw.add(name, *fut.result())
+        zw.close()
 
     def _validate_game_config(self, base_path):
         config_path = os.path.join(base_path, "game_config.json")
@@ -221,29 +350,46 @@ class DeveloperClient:
         meta["execution"] = config.get("execution", {})
         meta["author"] = self.username
 
-        print(f"[系統] 正在打包 {meta['game_name']} v{meta['version']} ...")
-
         try:
-            # 這裡打包時會讀取到剛剛更新過的 game_config.json
-            zip_data = self.zip_directory(path)
-            conn = self.connect()
-            if not conn:
+            # 除了版本號以外內容沒變的專案 server 上已經有了：只更新遊戲資訊，
+            # 不必重新打包上傳 (舊版 server 不認得這個 action，照常上傳)
+            manifest = _manifest_hash(path)
+            resp = self._rpc("game_check_hash",
+                             {"meta": meta, "manifest": manifest})
+            if not resp:
                 return
+            if resp["status"] == "success" and resp["data"].get("exists"):
+                print("[成功] 伺服器已有相同內容，略過打包上傳，遊戲資訊已更新")
+                return
+            # 不認得 game_check_hash 的舊版 server 也只收單一封包的上傳
+            chunked = resp["status"] == "success"
 
-            print(f"[系統] 上傳中 ({len(zip_data)} bytes)...")
-            send_message(conn, {
-                "action": "upload_game",
-                "data": {"meta": meta, "size": len(zip_data)}
-            })
-            send_file(conn, zip_data)
-
-            resp = recv_message(conn)
+            print(f"[系統] 正在打包 {meta['game_name']} v{meta['version']} ...")
+            # 這裡打包時會讀取到剛剛更新過的 game_config.json
+            sent = []
+
+            def send_zip(conn):
+                if not chunked:
+                    # 單一封包要先知道大小：打包到暫存檔再送
+                    with tempfile.TemporaryFile() as f:
+                        self.zip_directory(path, f)
+                        sent.append(send_fileobj(conn, f))
+                    return
+                # 邊壓縮邊以 chunked 區塊送出，不需要暫存檔或事先知道大小
+                w = ChunkedWriter(conn)
+                self.zip_directory(path, w)
+                sent.append(w.close())
+
+            print("[系統] 上傳中...")
+            resp = self._rpc("upload_game", {"meta": meta, "chunked": chunked,
+                                             "manifest": manifest},
+                             stream=send_zip)
+            if not resp:
+                return
             if resp["status"] == "success":
-                print("[成功] 遊戲上架/更新完成！")
+                print(f"[成功] 遊戲上架/更新完成！({sent[-1]} bytes)")
             else:
                 print(f"[失敗] {resp.get('message')}")
-
-            conn.close()
         except Exception as e:
             print(f"[錯誤] {e}")
 
@@ -252,23 +398,22 @@ class DeveloperClient:
         name = self._get_input("\n請輸入要下架的遊戲名稱: ")
         if not name:
             return
-        conn = self.connect()
-        if not conn:
+        resp = self._rpc("game_delete",
+                         {"game_name": name, "author": self.username})
+        if not resp:
             return
+        if resp["status"] == "success":
+            print(f"[成功] 遊戲 '{name}' 已下架")
+        else:
+            print(f"[失敗] {resp.get('message')}")
+
+    def run(self):
         try:
-            send_message(conn, {
-                "action": "game_delete",
-                "data": {"game_name": name, "author": self.username}
-            })
-            resp = recv_message(conn)
-            if resp["status"] == "success":
-                print(f"[成功] 遊戲 '{name}' 已下架")
-            else:
-                print(f"[失敗] {resp.get('message')}")
+            self._run()
         finally:
-            conn.close()
+            self.close()
 
-    def run(self):
+    def _run(self):
         if not self.auth_loop():
             return
         while True:
@@ -11,49 +11,95 @@ import traceback
 # === 網路穩定接收區 ===
 
 
-def recvall(sock, n):
-    data = b''
-    while len(data) < n:
+class FrameReader:
+    """每次 recv_into 盡量把 kernel 裡的資料一次讀完，
+    緩衝區裡已經有完整的 frame 就直接解析，不必再 recv"""
+
+    def __init__(self, sock, bufsize=65536):
+        self.sock = sock
+        self._buf = bytearray(bufsize)
+        self._start = 0  # 還沒解析的資料從這裡開始
+        self._end = 0    # 已收到的資料到這裡為止
+
+    def _next_body(self):
+        while True:
+            avail = self._end - self._start
+            need = 4
+            if avail >= 4:
+                (ln,) = struct.unpack_from("!I", self._buf, self._start)
+                need = 4 + ln
+                if avail >= need:
+                    s = self._start + 4
+                    body = self._buf[s:s + ln]
+                    self._start = s + ln
+                    if self._start == self._end:
+                        self._start = self._end = 0
+                    return body
+            # 後面放不下這個 frame：剩下的資料搬到開頭，還不夠就擴大
+            if self._start + need > len(self._buf):
+                self._buf[:avail] = self._buf[self._start:self._end]
+                self._start, self._end = 0, avail
+                if need > len(self._buf):
+                    self._buf.extend(bytes(need - len(self._buf)))
+            r = self.sock.recv_into(memoryview(self._buf)[self._end:])
+            if not r:
+                return None
+            self._end += r
+
+    def recv_msg(self):
         try:
-            packet = sock.recv(n - len(data))
-            if not packet:
+            body = self._next_body()
+            if not body:
                 return None
-            data += packet
+            return json.loads(body)
         except:
             return None
-    return data
 
+# === 畫圖區 ===
 
-def recv_msg(sock):
-    try:
-        hdr = recvall(sock, 4)
-        if not hdr:
-            return None
-        (ln,) = struct.unpack("!I", hdr)
-        body = recvall(sock, ln)
-        if not body:
-            return None
-        return json.loads(body.decode("utf-8"))
-    except:
-        return None
 
-# === 畫圖區 ===
+_DICE_CACHE = {}  # 點數 -> 畫好的骰子 Surface
 
 
-def draw_dice(screen, x, y, value, font):
-    pygame.draw.rect(screen, (250, 250, 250), (x, y, 50, 50), border_radius=8)
-    pygame.draw.rect(screen, (0, 0, 0), (x, y, 50, 50), 2, border_radius=8)
+def _render_dice(value, font):
+    surf = pygame.Surface((50, 50), pygame.SRCALPHA).convert_alpha()
+    pygame.draw.rect(surf, (250, 250, 250), (0, 0, 50, 50), border_radius=8)
+    pygame.draw.rect(surf, (0, 0, 0), (0, 0, 50, 50), 2, border_radius=8)
     if value > 0:
         color = (0, 0, 0)
         if value == 6:
             color = (200, 0, 0)
         txt = font.render(str(value), True, color)
-        text_rect = txt.get_rect(center=(x + 25, y + 25))
-        screen.blit(txt, text_rect)
     else:
         txt = font.render("?", True, (180, 180, 180))
-        text_rect = txt.get_rect(center=(x + 25, y + 25))
-        screen.blit(txt, text_rect)
+    surf.blit(txt, txt.get_rect(center=(25, 25)))
+    return surf
+
+
+_TEXT_CACHE = {}  # (font, 文字, 顏色) -> render 好的 Surface
+_TEXT_CACHE_MAX = 256
+
+
+def render_text(font, text, color):
+    # 文字沒變的幀直接用上次 render 的結果；快取滿了就整個清掉重來
+    key = (font, text, color)
+    surf = _TEXT_CACHE.get(key)
+    if surf is None:
+        if len(_TEXT_CACHE) >= _TEXT_CACHE_MAX:
+            _TEXT_CACHE.clear()
+        # 轉成跟畫面相同的像素格式，之後每次 blit 不必再轉換
+        surf = _TEXT_CACHE[key] = font.render(
+            text, True, color).convert_alpha()
+    return surf
+
+
+def draw_dice(screen, x, y, value, font):
+    # 每個點數只 render 一次，之後每幀直接 blit 快取的 Surface
+    key = value if value > 0 else 0
+    surf = _DICE_CACHE.get(key)
+    if surf is None:
+        surf = _DICE_CACHE[key] = _render_dice(key, font)
+    screen.blit(surf, (x, y))
 
 
 def game_loop(args):
@@ -65,6 +111,19 @@ def game_loop(args):
     dice_font = pygame.font.SysFont("Arial", 30, bold=True)
     big_font = pygame.font.SysFont("Arial", 50, bold=True)
     warn_font = pygame.font.SysFont("Arial", 40, bold=True)
+    for v in range(7):  # 骰子的七種樣子 (? 與 1~6) 先畫好
+        _DICE_CACHE[v] = _render_dice(v, dice_font)
+
+    # 固定的提示文字只 render 一次
+    click_me = warn_font.render(
+        "CLICK ME!", True, (255, 255, 255)).convert_alpha()
+    click_me_rect = click_me.get_rect(center=(400, 550))
+    click_me_bg = pygame.Surface(
+        (click_me.get_width()+20, click_me.get_height()+10)).convert()
+    click_me_bg.fill((255, 0, 0))
+    roll_hint = warn_font.render(
+        "CLICK or SPACE to ROLL!", True, (255, 255, 0)).convert_alpha()
+    roll_hint_rect = roll_hint.get_rect(center=(400, 550))
 
     print(f"Connecting to {args.host}:{args.port}...")
     s = None
@@ -82,55 +141,56 @@ def game_loop(args):
     s.settimeout(None)
     print("Connected! Ready to play.")
 
-    state = "WAITING"
-    msg_text = "Waiting for players..."
-    result_text = ""
-    game_data = {}
-    my_rolled = False
-
-    lock = threading.Lock()
+    # 畫面需要的狀態 (state, msg_text, result_text, game_data, 第幾回合)。
+    # 只有 listen 執行緒會寫：每次建一組新的 tuple 整個換掉，主迴圈一次讀走，
+    # 參考的指定是原子的，所以不需要 lock
+    ui = ("WAITING", "Waiting for players...", "", {}, 0)
     running = True
 
     def listen():
-        nonlocal state, msg_text, result_text, game_data, my_rolled, running
+        nonlocal ui, running
+        state, msg_text, result_text, game_data, round_no = ui
+        reader = FrameReader(s)
         while running:
             try:
-                data = recv_msg(s)
+                data = reader.recv_msg()
                 if not data:
                     print("Server disconnected.")
                     break
                 dtype = data.get("type")
-                with lock:
-                    if dtype == "INFO":
-                        msg_text = data.get("msg")
-                        # === [修正] 偵測 GAME OVER 訊號 ===
-                        if "GAME OVER" in msg_text:
-                            print("Game Over received. Exiting in 3 seconds...")
-                            time.sleep(3)  # 給玩家一點時間看訊息
-                            running = False
-                        # ===============================
-                    elif dtype == "START_ROUND":
-                        state = "ROLL"
-                        msg_text = f"Round {data.get('round')} - YOUR TURN!"
-                        result_text = ""
-                        game_data = {}
-                        my_rolled = False
-                    elif dtype == "PLAYER_ROLLED":
-                        pass
-                    elif dtype == "RESULT":
-                        state = "RESULT"
-                        winner = data.get("winner")
-                        game_data = data.get("data") or {}
-                        if "DRAW" in str(winner):
-                            if str(args.user_id) in winner:
-                                result_text = "DRAW! (Tie)"
-                            else:
-                                result_text = "DRAW"
-                        elif str(winner) == str(args.user_id):
-                            result_text = "YOU WIN! 🎉"
+                if dtype == "INFO":
+                    msg_text = data.get("msg")
+                    ui = (state, msg_text, result_text, game_data, round_no)
+                    # === [修正] 偵測 GAME OVER 訊號 ===
+                    if "GAME OVER" in msg_text:
+                        print("Game Over received. Exiting in 3 seconds...")
+                        time.sleep(3)  # 給玩家一點時間看訊息
+                        running = False
+                    # ===============================
+                elif dtype == "START_ROUND":
+                    state = "ROLL"
+                    msg_text = f"Round {data.get('round')} - YOUR TURN!"
+                    result_text = ""
+                    game_data = {}
+                    round_no += 1  # 新回合：主迴圈看到回合變了就能再擲
+                    ui = (state, msg_text, result_text, game_data, round_no)
+                elif dtype == "PLAYER_ROLLED":
+                    pass
+                elif dtype == "RESULT":
+                    state = "RESULT"
+                    winner = data.get("winner")
+                    game_data = data.get("data") or {}
+                    if "DRAW" in str(winner):
+                        if str(args.user_id) in winner:
+                            result_text = "DRAW! (Tie)"
                         else:
-                            result_text = f"Player {winner} WINS!"
-                        msg_text = "Round finished. Next round soon..."
+                            result_text = "DRAW"
+                    elif str(winner) == str(args.user_id):
+                        result_text = "YOU WIN! 🎉"
+                    else:
+                        result_text = f"Player {winner} WINS!"
+                    msg_text = "Round finished. Next round soon..."
+                    ui = (state, msg_text, result_text, game_data, round_no)
             except:
                 break
         running = False
@@ -140,23 +200,29 @@ def game_loop(args):
 
     clock = pygame.time.Clock()
 
+    # 主迴圈自己記錄在哪一回合擲過、擲的當下是哪一組 ui
+    # (在 listen 送來新訊息之前都顯示 "Rolled!")
+    rolled_round = None
+    rolled_ui = None
+
     # 定義觸發擲骰的函式
     def do_roll():
-        nonlocal my_rolled, msg_text
-        if state == "ROLL" and not my_rolled:
+        nonlocal rolled_round, rolled_ui
+        cur = ui
+        if cur[0] == "ROLL" and rolled_round != cur[4]:
             try:
-                my_rolled = True
-                with lock:
-                    msg_text = "Rolled! Good Luck..."
+                rolled_round, rolled_ui = cur[4], cur
                 s.sendall(f"{args.user_id}:ROLL".encode())
                 print(f"[Client] Sent ROLL command!")
             except Exception as e:
                 print(f"[Error] Send failed: {e}")
 
+    last_frame = None
     while running:
         is_focused = pygame.key.get_focused()
 
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
 
@@ -168,31 +234,47 @@ def game_loop(args):
                 if event.key == pygame.K_SPACE:
                     do_roll()
 
+        cur = ui
+        state, msg_text, result_text, game_data, round_no = cur
+        my_rolled = rolled_round == round_no
+        if rolled_ui is cur:
+            msg_text = "Rolled! Good Luck..."
+
+        # 畫面只由這些狀態決定 (閃爍只在輪到自己時才有)；都沒變、也沒有事件
+        # 時不必重畫與 flip，大部分時間 (等對手) 每幀幾乎不花時間
+        blink = state == "ROLL" and not my_rolled and \
+            (pygame.time.get_ticks() // 500) % 2
+        frame = (msg_text, state, result_text, game_data, my_rolled,
+                 is_focused, blink)
+        if frame == last_frame and not events:
+            clock.tick(30)
+            continue
+        last_frame = frame
+
         screen.fill((46, 139, 87))
 
-        with lock:
-            title = font.render(msg_text, True, (255, 255, 255))
-            screen.blit(title, (20, 20))
-
-            if state == "RESULT":
-                color = (255, 215, 0) if "YOU" in result_text else (
-                    200, 200, 200)
-                res_surf = big_font.render(result_text, True, color)
-                rect = res_surf.get_rect(center=(400, 300))
-                shadow = big_font.render(result_text, True, (0, 0, 0))
-                screen.blit(shadow, (rect.x+2, rect.y+2))
-                screen.blit(res_surf, rect)
-
-            opponents = []
-            my_info = {"dice": [0]*5, "score": 0, "uid": args.user_id}
-            if state == "RESULT" and game_data:
-                for uid, info in game_data.items():
-                    if str(uid) == str(args.user_id):
-                        my_info = info
-                        my_info["uid"] = uid
-                    else:
-                        info["uid"] = uid
-                        opponents.append(info)
+        title = render_text(font, msg_text, (255, 255, 255))
+        screen.blit(title, (20, 20))
+
+        if state == "RESULT":
+            color = (255, 215, 0) if "YOU" in result_text else (
+                200, 200, 200)
+            res_surf = render_text(big_font, result_text, color)
+            rect = res_surf.get_rect(center=(400, 300))
+            shadow = render_text(big_font, result_text, (0, 0, 0))
+            screen.blit(shadow, (rect.x+2, rect.y+2))
+            screen.blit(res_surf, rect)
+
+        opponents = []
+        my_info = {"dice": [0]*5, "score": 0, "uid": args.user_id}
+        if state == "RESULT" and game_data:
+            for uid, info in game_data.items():
+                if str(uid) == str(args.user_id):
+                    my_info = info
+                    my_info["uid"] = uid
+                else:
+                    info["uid"] = uid
+                    opponents.append(info)
 
         opp_positions = [(50, 80), (450, 80)]
         for i, pos in enumerate(opp_positions):
@@ -204,8 +286,8 @@ def game_loop(args):
             score_text = str(opp_data['score']) if opp_data else "?"
             dice_vals = opp_data['dice'] if opp_data else [0]*5
 
-            screen.blit(font.render(
-                f"{label_text} (Score: {score_text})", True, (200, 200, 200)), (ox+10, oy+10))
+            screen.blit(render_text(
+                font, f"{label_text} (Score: {score_text})", (200, 200, 200)), (ox+10, oy+10))
             for d_idx, val in enumerate(dice_vals):
                 draw_dice(screen, ox + 20 + d_idx*55, oy + 60, val, dice_font)
 
@@ -221,8 +303,8 @@ def game_loop(args):
         pygame.draw.rect(screen, bg_color,
                          (mx, my, 400, 150), border_radius=10)
         my_score_text = str(my_info['score']) if state == "RESULT" else "?"
-        screen.blit(font.render(
-            f"ME (Score: {my_score_text})", True, (155, 255, 155)), (mx+10, my+10))
+        screen.blit(render_text(
+            font, f"ME (Score: {my_score_text})", (155, 255, 155)), (mx+10, my+10))
         for d_idx, val in enumerate(my_info['dice']):
             val_draw = val
             if state != "RESULT":
@@ -232,18 +314,11 @@ def game_loop(args):
         # 提示文字更新
         if not is_focused:
             pygame.draw.rect(screen, (255, 50, 50), (0, 0, 800, 600), 8)
-            warn = warn_font.render("CLICK ME!", True, (255, 255, 255))
-            warn_bg = pygame.Surface(
-                (warn.get_width()+20, warn.get_height()+10))
-            warn_bg.fill((255, 0, 0))
-            rect = warn.get_rect(center=(400, 550))
-            screen.blit(warn_bg, (rect.x-10, rect.y-5))
-            screen.blit(warn, rect)
+            screen.blit(click_me_bg,
+                        (click_me_rect.x-10, click_me_rect.y-5))
+            screen.blit(click_me, click_me_rect)
         elif state == "ROLL" and not my_rolled:
-            msg = warn_font.render(
-                "CLICK or SPACE to ROLL!", True, (255, 255, 0))
-            rect = msg.get_rect(center=(400, 550))
-            screen.blit(msg, rect)
+            screen.blit(roll_hint, roll_hint_rect)
 
         pygame.display.flip()
         clock.tick(30)
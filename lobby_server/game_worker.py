@@ -0,0 +1,39 @@
+# lobby_server/game_worker.py
+# 預先啟動好的 Python 直譯器：等 lobby 從 stdin 送來一行 JSON 工作，
+# 再在本行程內執行遊戲 server，省掉開房時的直譯器冷啟動
+import json
+import os
+import runpy
+import sys
+
+# 遊戲 server 常用的模組先載入，接到工作時就不用再 import
+import argparse  # noqa: F401
+import random  # noqa: F401
+import select  # noqa: F401
+import socket  # noqa: F401
+import struct  # noqa: F401
+import threading  # noqa: F401
+import time  # noqa: F401
+
+
+def main():
+    line = sys.stdin.readline()
+    if not line:
+        return  # lobby 已關閉，這個備用 worker 用不到了
+    job = json.loads(line)
+    script = job["script"]
+
+    # 之後不再從 lobby 讀資料，stdin 改接 /dev/null
+    fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(fd, 0)
+    os.close(fd)
+
+    os.chdir(job["cwd"])
+    # 跟 `python script.py` 一樣：sys.path[0] 是腳本所在目錄
+    sys.path[0] = os.path.dirname(script)
+    sys.argv = [script] + job["args"]
+    runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
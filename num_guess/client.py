@@ -17,14 +17,29 @@ def send_msg(sock, data):
         pass
 
 
+def _readn(sock, n):
+    # recv 可能只收到一部分：一直讀到滿 n bytes，直接 recv_into 預先配置的緩衝區
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:], n - got)
+        if not r:
+            return None
+        got += r
+    return buf
+
+
 def recv_msg(sock):
     try:
-        hdr = sock.recv(4)
+        hdr = _readn(sock, 4)
         if not hdr:
             return None
         (ln,) = struct.unpack("!I", hdr)
-        body = sock.recv(ln)
-        return json.loads(body.decode("utf-8"))
+        body = _readn(sock, ln)
+        if body is None:
+            return None
+        return json.loads(body)
     except:
         return None
 
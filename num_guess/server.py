@@ -18,16 +18,31 @@ def send_msg(sock, data):
         pass
 
 
+def _readn(sock, n):
+    # recv 可能只收到一部分：一直讀到滿 n bytes，直接 recv_into 預先配置的緩衝區
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:], n - got)
+        if not r:
+            return None
+        got += r
+    return buf
+
+
 def recv_msg(sock):
     try:
-        hdr = sock.recv(4)
+        hdr = _readn(sock, 4)
         if not hdr:
             return None
         (ln,) = struct.unpack("!I", hdr)
         if ln > MAX_LEN:
             return None
-        body = sock.recv(ln)
-        return json.loads(body.decode("utf-8"))
+        body = _readn(sock, ln)
+        if body is None:
+            return None
+        return json.loads(body)
     except:
         return None
 
@@ -54,12 +69,14 @@ def main():
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.bind((args.host, args.port))
     s.listen(5)
-    s.settimeout(1.0)  # 這是為了讓 accept 迴圈不卡死
 
     # 1. 等待連線
-    wait_start = time.time()
+    # accept 的 timeout 設成離期限剩下的時間：沒人連線時不必每秒醒來一次，
+    # 期限到了 accept 直接丟 socket.timeout (Ctrl+C 照樣會中斷 accept)
+    deadline = time.time() + 60  # 延長等待時間到 60秒
     while len(conns) < len(expected_users):
         try:
+            s.settimeout(max(deadline - time.time(), 0.001))
             c, a = s.accept()
             c.settimeout(None)  # [關鍵修正] 連線建立後，移除超時限制！
 
@@ -72,12 +89,9 @@ def main():
                     send_msg(c, {"type": "WELCOME", "msg": "等待其他玩家..."})
                 else:
                     c.close()
-
-            if time.time() - wait_start > 60:  # 延長等待時間到 60秒
-                print("[Server] 等待超時")
-                break
         except socket.timeout:
-            continue
+            print("[Server] 等待超時")
+            break
         except Exception as e:
             print(f"[Server] 連線錯誤: {e}")
 
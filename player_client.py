@@ -3,12 +3,12 @@ import socket
 import json
 import os
 import zipfile
-import io
 import subprocess
 import sys
 import argparse
+import tempfile
 import time
-from utils.protocol import send_message, recv_message, recv_file
+from utils.protocol import send_message, recv_message, recv_file_into
 
 
 class PlayerClient:
@@ -238,16 +238,19 @@ class PlayerClient:
                 print(f"[失敗] {resp.get('message')}")
                 return
             meta = resp["data"]
-            zip_data = recv_file(conn)
-
-            install_path = os.path.join(self.base_dir, game_name)
-            import shutil
-            if os.path.exists(install_path):
-                shutil.rmtree(install_path)
-            os.makedirs(install_path, exist_ok=True)
-
-            with zipfile.ZipFile(io.BytesIO(zip_data)) as zf:
-                zf.extractall(install_path)
+            # zip 直接串流到暫存檔，不整包放在記憶體
+            with tempfile.TemporaryFile() as zip_file:
+                recv_file_into(conn, zip_file)
+                zip_file.seek(0)
+
+                install_path = os.path.join(self.base_dir, game_name)
+                import shutil
+                if os.path.exists(install_path):
+                    shutil.rmtree(install_path)
+                os.makedirs(install_path, exist_ok=True)
+
+                with zipfile.ZipFile(zip_file) as zf:
+                    zf.extractall(install_path)
 
             with open(os.path.join(install_path, "execution.json"), "w", encoding="utf-8") as f:
                 json.dump(meta, f, indent=2, ensure_ascii=False)
@@ -3,11 +3,13 @@ import sys
 import time
 import traceback
 import os
+from collections import deque
 
 # [關鍵修正] 全域錯誤捕捉，防止 import pygame 失敗時閃退
 try:
     import argparse
     import json
+    import selectors
     import socket
     import struct
     import threading
@@ -15,7 +17,7 @@ try:
 except ImportError as e:
     print("="*60)
     print(f"[嚴重錯誤] 套件載入失敗: {e}")
-    print("請確認你的 Python 環境是否有安裝 pygame (pip install pygame)")
+    print("請確認你的 Python 環境是否有安裝 pygame (建議 pip install pygame-ce)")
     print(f"目前使用的 Python: {sys.executable}")
     print("="*60)
     input("按 Enter 鍵離開...")
@@ -60,52 +62,225 @@ SHAPES = {
 ORDER = ["I", "O", "T", "S", "Z", "J", "L"]
 
 
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫
+    orjson = None
+
+
+_HDR = struct.Struct("!I")  # 4-byte 長度前綴，格式只解析一次
+
+# SNAPSHOT 是二進位 body (第一個 byte 為 _SNAP_TAG，JSON 一定以 '{' 開頭)：
+#   tag(1) + meta 長度(2) + meta JSON + 每個棋盤 W*H/2 bytes
+#   (每格 4 bits 的顏色 id，高位在前；我方在前，對手依 opponents 的順序)
+_SNAP_TAG = 0x01
+_SNAP_HDR = struct.Struct("!BH")
+# 差異快照 (第一個 byte 為 _DELTA_TAG)：套用在上一個快照上
+#   tag(1) + meta 長度(2) + 棋盤 mask(2) + meta JSON (只有變動的欄位)
+#   + mask 中 bit i 為 1 的棋盤 (順序同完整快照)
+_DELTA_TAG = 0x02
+_DELTA_HDR = struct.Struct("!BHH")
+_NYBBLES = [(b >> 4, b & 0x0F) for b in range(256)]  # byte -> 兩格
+_BOARD_BYTES = BOARD_W * BOARD_H // 2
+
+_last_snap = None  # 最近一次的完整快照 (差異快照套用在它上面)
+
+
+def _unpack_board(body, off):
+    row_len = BOARD_W // 2
+    return [[v for b in body[off + r * row_len:off + (r + 1) * row_len]
+             for v in _NYBBLES[b]]
+            for r in range(BOARD_H)]
+
+
+def _unpack_snapshot(body):
+    global _last_snap
+    _, mlen = _SNAP_HDR.unpack_from(body)
+    off = _SNAP_HDR.size
+    msg = _loads(body[off:off + mlen])
+    off += mlen
+    for target in [msg] + (msg.get("opponents") or []):
+        target["board"] = _unpack_board(body, off)
+        off += _BOARD_BYTES
+    _last_snap = msg
+    return msg
+
+
+def _unpack_delta(body):
+    global _last_snap
+    _, mlen, mask = _DELTA_HDR.unpack_from(body)
+    off = _DELTA_HDR.size
+    delta = _loads(body[off:off + mlen])
+    off += mlen
+    prev = _last_snap
+    if prev is None:
+        raise ValueError("delta snapshot before keyframe")
+    # 組一份新的 dict，不改到畫面執行緒可能正在用的上一個快照
+    msg = dict(prev)
+    msg.update(delta)
+    prev_opps = prev.get("opponents") or []
+    if "opponents" in delta:
+        opps = delta["opponents"]
+    else:
+        opps = [dict(o) for o in prev_opps]
+    msg["opponents"] = opps
+    for i, (target, old) in enumerate(zip([msg] + opps, [prev] + prev_opps)):
+        if mask & (1 << i):
+            target["board"] = _unpack_board(body, off)
+            off += _BOARD_BYTES
+        else:
+            target["board"] = old["board"]
+    _last_snap = msg
+    return msg
+
+
+def _loads(body):
+    if orjson is not None:  # 每秒十幾個快照，orjson 解析快很多
+        return orjson.loads(body)
+    return json.loads(body)
+
+
 def _readn(sock, n):
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+    # 預先配置緩衝區直接 recv_into，避免 buf += chunk 的 O(n^2) 複製
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:], n - got)
+        if not r:
             raise ConnectionError("socket closed")
-        buf += chunk
+        got += r
     return buf
 
 
+def _decode(body):
+    if body[0] == _SNAP_TAG:
+        return _unpack_snapshot(body)
+    if body[0] == _DELTA_TAG:
+        return _unpack_delta(body)
+    return _loads(body)
+
+
 def recv_msg(sock):
-    hdr = _readn(sock, 4)
-    (ln,) = struct.unpack("!I", hdr)
+    (ln,) = _HDR.unpack(_readn(sock, _HDR.size))
     if not (0 < ln <= MAX_LEN):
         raise ValueError("bad length")
-    body = _readn(sock, ln)
-    return json.loads(body.decode("utf-8"))
+    return _decode(_readn(sock, ln))
+
+
+class MsgReader:
+    """用 selector 等 socket 可讀，每次 recv_into 盡量讀滿，
+    一次拿到目前已到達的所有訊息 (socket 維持 blocking，主執行緒照常 send)"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(sock, selectors.EVENT_READ)
+        # 兩個最大 frame 的空間：搬移殘留資料後一定放得下下一個完整 frame
+        self._buf = bytearray(2 * (_HDR.size + MAX_LEN))
+        self._start = 0
+        self._end = 0
+
+    def _fill(self):
+        if self._start:  # 上次剩下的半個 frame 搬到開頭
+            n = self._end - self._start
+            self._buf[:n] = self._buf[self._start:self._end]
+            self._start, self._end = 0, n
+        r = self.sock.recv_into(memoryview(self._buf)[self._end:])
+        if not r:
+            raise ConnectionError("socket closed")
+        self._end += r
+
+    def read_all(self, timeout=0.05):
+        """最多等 timeout 秒，回傳 kernel 裡已經收到的所有訊息 (可能是空的)"""
+        msgs = []
+        wait = timeout
+        while self.sel.select(wait):
+            self._fill()
+            wait = 0  # 之後只看還有沒有剩下的資料，不再等待
+            while self._end - self._start >= _HDR.size:
+                (ln,) = _HDR.unpack_from(self._buf, self._start)
+                if not (0 < ln <= MAX_LEN):
+                    raise ValueError("bad length")
+                s = self._start + _HDR.size
+                if self._end < s + ln:
+                    break
+                msgs.append(_decode(self._buf[s:s + ln]))
+                self._start = s + ln
+        return msgs
 
 
 def send_msg(sock, obj):
-    body = json.dumps(obj, separators=(",", ":"),
-                      ensure_ascii=False).encode("utf-8")
-    sock.sendall(struct.pack("!I", len(body)) + body)
+    if orjson is not None:
+        body = orjson.dumps(obj)
+    else:
+        body = json.dumps(obj, separators=(",", ":"),
+                          ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HDR.pack(len(body)) + body)
+
+
+_GRID_CACHE = {}  # (w, h, cell, 顏色) -> 只有格線的透明 Surface
 
 
 def draw_grid(surface, x, y, w, h, cell, grid_color):
-    pygame.draw.rect(surface, grid_color, (x-1, y-1, w*cell+2, h*cell+2), 1)
-    for i in range(w):
-        pygame.draw.line(surface, grid_color, (x+i*cell, y),
-                         (x+i*cell, y+h*cell), 1)
-    for j in range(h):
-        pygame.draw.line(surface, grid_color, (x, y+j*cell),
-                         (x+w*cell, y+j*cell), 1)
+    # 格線不會變：第一次畫進透明 Surface，之後每幀只 blit 一次
+    key = (w, h, cell, grid_color)
+    grid = _GRID_CACHE.get(key)
+    if grid is None:
+        grid = pygame.Surface((w*cell+2, h*cell+2),
+                              pygame.SRCALPHA).convert_alpha()
+        pygame.draw.rect(grid, grid_color, (0, 0, w*cell+2, h*cell+2), 1)
+        for i in range(w):
+            pygame.draw.line(grid, grid_color, (1+i*cell, 1),
+                             (1+i*cell, 1+h*cell), 1)
+        for j in range(h):
+            pygame.draw.line(grid, grid_color, (1, 1+j*cell),
+                             (1+w*cell, 1+j*cell), 1)
+        _GRID_CACHE[key] = grid
+    surface.blit(grid, (x-1, y-1))
+
+
+_CELL_CACHE = {}  # (顏色, 格子大小) -> 畫好的方塊 Surface
+
+
+def _cell_surface(color, cell):
+    # 每種顏色 / 大小只畫一次圓角方塊，之後每幀直接 blit。
+    # 四周 1px 的透明邊框也畫進去，Surface 寬度就是整格 (24 / 12)，
+    # 比 22 / 10 這種寬度更容易走 SDL 的 SIMD blit
+    key = (color, cell)
+    surf = _CELL_CACHE.get(key)
+    if surf is None:
+        surf = pygame.Surface((cell, cell), pygame.SRCALPHA).convert_alpha()
+        pygame.draw.rect(surf, color, (1, 1, cell-2, cell-2), border_radius=3)
+        _CELL_CACHE[key] = surf
+    return surf
+
+
+_BOARD_SEQ = {}  # (x, y, cell, is_alive) -> (board, blits 序列)
 
 
 def draw_board(surface, x, y, board, cell, is_alive=True):
     if not is_alive:
         pygame.draw.rect(surface, (40, 20, 20), (x, y, 10*cell, 20*cell))
+    # 只收集有方塊的格子，最後用一次 blits 畫完。棋盤沒變時 (收到的快照
+    # 沿用同一個 list) 直接用上次收集好的序列，不必再掃 200 格
+    key = (x, y, cell, is_alive)
+    cached = _BOARD_SEQ.get(key)
+    if cached is not None and cached[0] is board:
+        surface.blits(cached[1], False)
+        return
+    seq = []
     for j, row in enumerate(board):
+        if not any(row):  # 空的列 (上半部大多是) 整列跳過
+            continue
         for i, v in enumerate(row):
             if v:
                 col = PIECE_COLORS.get(int(v), PIECE_COLORS[8])
                 if not is_alive:
                     col = (80, 80, 80)
-                pygame.draw.rect(
-                    surface, col, (x+i*cell+1, y+j*cell+1, cell-2, cell-2), border_radius=3)
+                seq.append((_cell_surface(col, cell), (x+i*cell, y+j*cell)))
+    _BOARD_SEQ[key] = (board, seq)
+    surface.blits(seq, False)
 
 
 def draw_active_piece(surface, x, y, active, cell):
@@ -118,18 +293,29 @@ def draw_active_piece(surface, x, y, active, cell):
         return
     color_id = ORDER.index(shape) + 1
     color = PIECE_COLORS.get(color_id, PIECE_COLORS[8])
+    block = _cell_surface(color, cell)
     for (dx, dy) in SHAPES[shape][rot % 4]:
         bx, by = px + dx, py + dy
         if 0 <= bx < BOARD_W and 0 <= by < BOARD_H:
-            pygame.draw.rect(surface, color, (x+bx*cell+1, y +
-                             by*cell+1, cell-2, cell-2), border_radius=3)
+            surface.blit(block, (x+bx*cell, y+by*cell))
+
+
+_TEXT_CACHE = {}  # (font, 文字, 顏色) -> (陰影, 文字) Surface
 
 
 def nice_text(surface, font, txt, color, center):
-    s = font.render(txt, True, (0, 0, 0))
+    # 文字沒變就重用上次 render 並 convert 過的 Surface
+    key = (font, txt, color)
+    pair = _TEXT_CACHE.get(key)
+    if pair is None:
+        if len(_TEXT_CACHE) >= 256:
+            _TEXT_CACHE.clear()
+        pair = _TEXT_CACHE[key] = (
+            font.render(txt, True, (0, 0, 0)).convert_alpha(),
+            font.render(txt, True, color).convert_alpha())
+    s, img = pair
     r = s.get_rect(center=(center[0]+2, center[1]+2))
     surface.blit(s, r)
-    img = font.render(txt, True, color)
     surface.blit(img, img.get_rect(center=center))
 
 
@@ -178,49 +364,52 @@ def main():
         print("[Client] HELLO sent.")
 
         # Game State
-        my_state = {"board": [[0]*10 for _ in range(20)],
-                    "score": 0, "lines": 0, "active": None}
-        opponents = []
+        # (我方狀態, 對手列表)：rx 執行緒每次建一組新的整個換掉，畫面執行緒
+        # 一次讀走整組；參考的指定本身是原子的，不必上鎖，也不會讀到一半
+        view = ({"board": [[0]*10 for _ in range(20)],
+                 "score": 0, "lines": 0, "active": None}, [])
+        # 以下也只有 rx 執行緒會寫、畫面執行緒只讀，都是單一參考的指定，
+        # 不需要 lock
         final_result = None
         countdown = None
         disconnected = False
-        lock = threading.Lock()
         plugins = []
+        # plugin 訊息交給畫面執行緒處理，plugin 的 callback 都在同一條執行緒
+        plugin_msgs = deque()
 
         def rx_loop():
-            nonlocal final_result, countdown, disconnected, opponents
+            nonlocal final_result, countdown, disconnected, view
+            reader = MsgReader(net_sock)
             try:
                 while True:
-                    msg = recv_msg(net_sock)
-                    t = msg.get("type")
+                    # 一次處理所有已到達的訊息；快照只需套用最新的一個
+                    # (差異快照仍會在 read_all 裡依序解開)
+                    snap = None
+                    for msg in reader.read_all():
+                        t = msg.get("type")
 
-                    if t == "COUNTDOWN":
-                        with lock:
+                        if t == "COUNTDOWN":
                             countdown = msg.get("seconds")
-                    elif t == "START":
-                        with lock:
+                        elif t == "START":
                             countdown = None
-                    elif t == "SNAPSHOT":
-                        with lock:
-                            my_state["board"] = msg.get("board")
-                            my_state["score"] = msg.get("score")
-                            my_state["lines"] = msg.get("lines")
-                            my_state["active"] = msg.get("active")
-
-                            raw_opp = msg.get("opponents")
-                            if raw_opp is None:
-                                single = msg.get("opponent")
-                                opponents = [single] if single else []
-                            else:
-                                opponents = raw_opp
-                    elif t == "GAME_OVER":
-                        with lock:
+                        elif t == "SNAPSHOT":
+                            snap = msg
+                        elif t == "GAME_OVER":
                             final_result = msg
-                    elif t == "PLUGIN" or t == "CHAT":
-                        with lock:
-                            for p in plugins:
-                                if hasattr(p, "on_message"):
-                                    p.on_message(msg)
+                        elif t == "PLUGIN" or t == "CHAT":
+                            if plugins:
+                                plugin_msgs.append(msg)
+                    if snap is None:
+                        continue
+                    me = {"board": snap.get("board"),
+                          "score": snap.get("score"),
+                          "lines": snap.get("lines"),
+                          "active": snap.get("active")}
+                    raw_opp = snap.get("opponents")
+                    if raw_opp is None:
+                        single = snap.get("opponent")
+                        raw_opp = [single] if single else []
+                    view = (me, raw_opp)
             except Exception as e:
                 print(f"[Network] Disconnected: {e}")
                 disconnected = True
@@ -229,6 +418,7 @@ def main():
         clock = pygame.time.Clock()
 
         running = True
+        last_frame = None
         while running:
             events = pygame.event.get()
             for ev in events:
@@ -265,14 +455,27 @@ def main():
                     if hasattr(p, "handle_event"):
                         p.handle_event(ev)
 
-            screen.fill(BG)
+            while plugin_msgs:
+                msg = plugin_msgs.popleft()
+                for p in plugins:
+                    if hasattr(p, "on_message"):
+                        p.on_message(msg)
+
+            me, opps = view
+            cd = countdown
+            fin = final_result
+            disc = disconnected
+
+            # 沒有新快照、狀態沒變、也沒有事件 (含視窗重新露出) 時畫面不會變，
+            # 整幀都不必重畫與 flip；plugin 可能自己在動，有的話照常重畫
+            frame = (view, cd, fin, disc)
+            if frame == last_frame and not events and \
+                    not any(hasattr(p, "draw") for p in plugins):
+                clock.tick(60)
+                continue
+            last_frame = frame
 
-            with lock:
-                me = my_state.copy()
-                opps = list(opponents)
-                cd = countdown
-                fin = final_result
-                disc = disconnected
+            screen.fill(BG)
 
             # Draw Self
             mx, my = MARGIN + 120, MARGIN
@@ -42,48 +42,166 @@ SHAPES = {
 }
 
 
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫
+    orjson = None
+
+
+_HDR = struct.Struct("!I")  # 4-byte 長度前綴，格式只解析一次
+
+# SNAPSHOT 是二進位 body (第一個 byte 為 _SNAP_TAG，JSON 一定以 '{' 開頭)：
+#   tag(1) + meta 長度(2) + meta JSON + 每個棋盤 W*H/2 bytes
+#   (每格 4 bits 的顏色 id，高位在前；我方在前，對手依 opponents 的順序)
+_SNAP_TAG = 0x01
+_SNAP_HDR = struct.Struct("!BH")
+# 差異快照 (第一個 byte 為 _DELTA_TAG)：套用在上一個快照上
+#   tag(1) + meta 長度(2) + 棋盤 mask(2) + meta JSON (只有變動的欄位)
+#   + mask 中 bit i 為 1 的棋盤 (順序同完整快照)
+_DELTA_TAG = 0x02
+_DELTA_HDR = struct.Struct("!BHH")
+_NYBBLES = [(b >> 4, b & 0x0F) for b in range(256)]  # byte -> 兩格
+_BOARD_BYTES = BOARD_W * BOARD_H // 2
+
+_last_snap = None  # 最近一次的完整快照 (差異快照套用在它上面)
+
+
+def _unpack_board(body, off):
+    row_len = BOARD_W // 2
+    return [[v for b in body[off + r * row_len:off + (r + 1) * row_len]
+             for v in _NYBBLES[b]]
+            for r in range(BOARD_H)]
+
+
+def _unpack_snapshot(body):
+    global _last_snap
+    _, mlen = _SNAP_HDR.unpack_from(body)
+    off = _SNAP_HDR.size
+    msg = _loads(body[off:off + mlen])
+    off += mlen
+    for target in [msg] + (msg.get("opponents") or []):
+        target["board"] = _unpack_board(body, off)
+        off += _BOARD_BYTES
+    _last_snap = msg
+    return msg
+
+
+def _unpack_delta(body):
+    global _last_snap
+    _, mlen, mask = _DELTA_HDR.unpack_from(body)
+    off = _DELTA_HDR.size
+    delta = _loads(body[off:off + mlen])
+    off += mlen
+    prev = _last_snap
+    if prev is None:
+        raise ValueError("delta snapshot before keyframe")
+    # 組一份新的 dict，不改到畫面執行緒可能正在用的上一個快照
+    msg = dict(prev)
+    msg.update(delta)
+    prev_opps = prev.get("opponents") or []
+    if "opponents" in delta:
+        opps = delta["opponents"]
+    else:
+        opps = [dict(o) for o in prev_opps]
+    msg["opponents"] = opps
+    for i, (target, old) in enumerate(zip([msg] + opps, [prev] + prev_opps)):
+        if mask & (1 << i):
+            target["board"] = _unpack_board(body, off)
+            off += _BOARD_BYTES
+        else:
+            target["board"] = old["board"]
+    _last_snap = msg
+    return msg
+
+
+def _loads(body):
+    if orjson is not None:  # 每秒十幾個快照，orjson 解析快很多
+        return orjson.loads(body)
+    return json.loads(body)
+
+
 def _readn(s, n):
-    buf = b""
-    while len(buf) < n:
-        b = s.recv(n - len(buf))
-        if not b:
+    # 預先配置緩衝區直接 recv_into，避免 buf += chunk 的 O(n^2) 複製
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = s.recv_into(view[got:], n - got)
+        if not r:
             raise ConnectionError("socket closed")
-        buf += b
+        got += r
     return buf
 
 
 def recv_msg(s):
-    hdr = _readn(s, 4)
-    (ln,) = struct.unpack("!I", hdr)
+    (ln,) = _HDR.unpack(_readn(s, _HDR.size))
     if not (0 < ln <= MAX_LEN):
         raise ValueError("bad length")
     body = _readn(s, ln)
-    return json.loads(body.decode("utf-8"))
+    if body[0] == _SNAP_TAG:
+        return _unpack_snapshot(body)
+    if body[0] == _DELTA_TAG:
+        return _unpack_delta(body)
+    return _loads(body)
 
 
 def send_msg(s, obj):
-    body = json.dumps(obj, separators=(",", ":"),
-                      ensure_ascii=False).encode("utf-8")
+    if orjson is not None:
+        body = orjson.dumps(obj)
+    else:
+        body = json.dumps(obj, separators=(",", ":"),
+                          ensure_ascii=False).encode("utf-8")
     if not (0 < len(body) <= MAX_LEN):
         raise ValueError("too large")
-    s.sendall(struct.pack("!I", len(body)) + body)
+    s.sendall(_HDR.pack(len(body)) + body)
+
+
+_GRID_CACHE = {}  # (w, h, cell) -> 只有格線的透明 Surface
 
 
 def draw_grid(surf, x, y, w, h, cell):
-    pygame.draw.rect(surf, GRID, (x-1, y-1, w*cell+2, h*cell+2), 1)
-    for i in range(w):
-        pygame.draw.line(surf, GRID, (x+i*cell, y), (x+i*cell, y+h*cell), 1)
-    for j in range(h):
-        pygame.draw.line(surf, GRID, (x, y+j*cell), (x+w*cell, y+j*cell), 1)
+    # 格線不會變：第一次畫進透明 Surface，之後每幀只 blit 一次
+    key = (w, h, cell)
+    grid = _GRID_CACHE.get(key)
+    if grid is None:
+        grid = pygame.Surface((w*cell+2, h*cell+2),
+                              pygame.SRCALPHA).convert_alpha()
+        pygame.draw.rect(grid, GRID, (0, 0, w*cell+2, h*cell+2), 1)
+        for i in range(w):
+            pygame.draw.line(grid, GRID, (1+i*cell, 1), (1+i*cell, 1+h*cell), 1)
+        for j in range(h):
+            pygame.draw.line(grid, GRID, (1, 1+j*cell), (1+w*cell, 1+j*cell), 1)
+        _GRID_CACHE[key] = grid
+    surf.blit(grid, (x-1, y-1))
+
+
+_CELL_CACHE = {}  # (顏色, 格子大小) -> 畫好的方塊 Surface
+
+
+def _cell_surface(color, cell):
+    # 每種顏色 / 大小只畫一次圓角方塊，之後每幀直接 blit。
+    # 四周 1px 的透明邊框也畫進去，Surface 寬度就是整格 (24 / 12)，
+    # 比 22 / 10 這種寬度更容易走 SDL 的 SIMD blit
+    key = (color, cell)
+    surf = _CELL_CACHE.get(key)
+    if surf is None:
+        surf = pygame.Surface((cell, cell), pygame.SRCALPHA).convert_alpha()
+        pygame.draw.rect(surf, color, (1, 1, cell-2, cell-2), border_radius=3)
+        _CELL_CACHE[key] = surf
+    return surf
 
 
 def draw_board(surf, x, y, board, cell):
+    # 只收集有方塊的格子，最後用一次 blits 畫完
+    seq = []
     for j, row in enumerate(board):
+        if not any(row):  # 空的列 (上半部大多是) 整列跳過
+            continue
         for i, v in enumerate(row):
             if v:
                 col = PIECE_COLORS.get(int(v), (180, 180, 180))
-                pygame.draw.rect(
-                    surf, col, (x+i*cell+1, y+j*cell+1, cell-2, cell-2), border_radius=3)
+                seq.append((_cell_surface(col, cell), (x+i*cell, y+j*cell)))
+    surf.blits(seq, False)
 
 
 def draw_active(surf, x, y, active, cell):
@@ -96,11 +214,11 @@ def draw_active(surf, x, y, active, cell):
     if shape not in SHAPES:
         return
     color = PIECE_COLORS.get(ORDER.index(shape)+1, (200, 200, 200))
+    block = _cell_surface(color, cell)
     for dx, dy in SHAPES[shape][rot % 4]:
         bx, by = px+dx, py+dy
         if 0 <= bx < BOARD_W and 0 <= by < BOARD_H:
-            pygame.draw.rect(surf, color, (x+bx*cell+1, y+by *
-                             cell+1, cell-2, cell-2), border_radius=3)
+            surf.blit(block, (x+bx*cell, y+by*cell))
 
 
 def main():
@@ -1,47 +1,72 @@
 # server/game_server.py
-from typing import Dict, List, Optional, Tuple
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import deque
 import time
 import threading
 import struct
 import socket
-import select
+import selectors
 import random
 import json
 import argparse
 import sys
 import os
 
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫
+    orjson = None
+
 # 允許從套件外相對匯入
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
     from tetris_engine import (
-        TetrisEngine, rle_encode_board,
-        EngineSnapshot, GravityPlan, make_bag_rng
+        TetrisEngine, EngineSnapshot, GravityPlan, make_bag_rng
     )
 except Exception:
     sys.path.insert(0, os.path.dirname(
         os.path.dirname(os.path.abspath(__file__))))
     from game_server.tetris_engine import (
-        TetrisEngine, rle_encode_board,
-        EngineSnapshot, GravityPlan, make_bag_rng
+        TetrisEngine, EngineSnapshot, GravityPlan, make_bag_rng
     )
 
 MAX_BODY = 65536
 WELCOME_VERSION = 1
+BASE_TICK_MS = 20
+SNAPSHOT_TICKS = 3  # 每 60ms 廣播一次快照
+KEYFRAME_SNAPSHOTS = 30  # 每 30 次快照送一次完整的，其餘只送差異
+
+# SNAPSHOT 用二進位 body，其他訊息維持 JSON。JSON body 一定以 '{' 開頭，
+# 所以第一個 byte 是 _SNAP_TAG 就是快照：
+#   tag(1) + meta 長度(2) + meta JSON (不含棋盤)
+#   + 每個棋盤 W*H/2 bytes (每格 4 bits，我方在前，對手依 opponents 的順序)
+_SNAP_TAG = 0x01
+_SNAP_HDR = struct.Struct("!BH")
+_FRAME_SNAP_HDR = struct.Struct("!IBH")  # 4-byte 長度前綴 + _SNAP_HDR
+# 差異快照 (第一個 byte 是 _DELTA_TAG)，client 套用在上一個快照上：
+#   tag(1) + meta 長度(2) + 棋盤 mask(2) + meta JSON (只有變動的欄位)
+#   + mask 中 bit i 為 1 的棋盤 (順序同完整快照)
+_DELTA_TAG = 0x02
+_DELTA_HDR = struct.Struct("!BHH")
+_FRAME_DELTA_HDR = struct.Struct("!IBHH")
+_DELTA_MAX_BOARDS = 16
 
 
 class ClosedError(Exception):
     pass
 
 
-def _readn(sock: socket.socket, n: int) -> bytes:
-    buf = bytearray()
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+def _readn(sock: socket.socket, n: int) -> bytearray:
+    # 預先配置緩衝區直接 recv_into，不必每次 recv 產生新的 bytes 再複製
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:], n - got)
+        if not r:
             raise ClosedError("socket closed while reading")
-        buf.extend(chunk)
-    return bytes(buf)
+        got += r
+    return buf
 
 
 def recv_message(sock: socket.socket) -> dict:
@@ -50,15 +75,87 @@ def recv_message(sock: socket.socket) -> dict:
     if ln <= 0 or ln > MAX_BODY:
         raise ClosedError(f"invalid length {ln}")
     body = _readn(sock, ln)
-    return json.loads(body.decode("utf-8"))
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _dumps(obj) -> bytes:
+    # 快照每秒送十幾次，orjson 編碼快好幾倍且直接回傳 bytes
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+
+def pack_snapshot(meta: bytes, boards: List[bytes]) -> List[bytes]:
+    """回傳完整 frame (含長度前綴) 的各段，交給 send_parts 送出"""
+    # meta: 已編碼好的 JSON
+    n = _SNAP_HDR.size + len(meta) + sum(map(len, boards))
+    return [_FRAME_SNAP_HDR.pack(n, _SNAP_TAG, len(meta)), meta] + boards
+
+
+def pack_delta(meta: bytes, mask: int, boards: List[bytes]) -> List[bytes]:
+    """同 pack_snapshot，但是差異快照 (格式見 _DELTA_TAG)"""
+    n = _DELTA_HDR.size + len(meta) + sum(map(len, boards))
+    return [_FRAME_DELTA_HDR.pack(n, _DELTA_TAG, len(meta), mask),
+            meta] + boards
+
+
+def send_parts(sock: socket.socket, parts: List[bytes]) -> None:
+    # scatter-gather: 各段一次 sendmsg 交給 kernel，不先串接成一整塊
+    if not hasattr(sock, "sendmsg"):  # Windows 沒有 sendmsg
+        sock.sendall(b"".join(parts))
+        return
+    parts = [memoryview(p) for p in parts]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while sent:
+            if sent >= len(parts[0]):
+                sent -= len(parts[0])
+                parts.pop(0)
+            else:
+                parts[0] = parts[0][sent:]
+                sent = 0
 
 
 def send_message(sock: socket.socket, obj: dict) -> None:
-    b = json.dumps(obj, separators=(",", ":"),
-                   ensure_ascii=False).encode("utf-8")
+    send_raw(sock, _dumps(obj))
+
+
+def frame_message(obj: dict) -> bytes:
+    """編碼成完整的 frame (含長度前綴)"""
+    b = _dumps(obj)
     if len(b) > MAX_BODY or len(b) == 0:
         raise ValueError("message too large or empty")
-    sock.sendall(struct.pack("!I", len(b)) + b)
+    return struct.pack("!I", len(b)) + b
+
+
+def broadcast(conns: List["PlayerConn"], obj: dict) -> None:
+    # 同一則訊息只編碼一次，每個收件者送同一份 bytes；個別送失敗就略過
+    framed = frame_message(obj)
+    for c in conns:
+        if c.alive:
+            try:
+                c.sock.sendall(framed)
+            except Exception:
+                pass
+
+
+_tls = threading.local()  # 每條執行緒重複使用的送出緩衝區
+
+
+def send_raw(sock: socket.socket, b: bytes) -> None:
+    n = len(b)
+    if n > MAX_BODY or n == 0:
+        raise ValueError("message too large or empty")
+    # header 與 body 直接寫進重複使用的緩衝區，不必每次配置新的 bytes
+    buf = getattr(_tls, "buf", None)
+    if buf is None:
+        buf = _tls.buf = bytearray(4 + MAX_BODY)
+    struct.pack_into("!I", buf, 0, n)
+    buf[4:4 + n] = b
+    sock.sendall(memoryview(buf)[:4 + n])
 
 
 class PlayerConn:
@@ -105,6 +202,15 @@ class GameRoom:
         self.scores = [0] * len(users)
         self.levels = [1] * len(users)
         self.gravity = GravityPlan(mode="fixed", drop_ms=drop_ms)
+        # 快照 meta 中整局不變的部分 (type / userId / gravityPlan) 先編碼好，
+        # 每次廣播只編碼會變的欄位再接上去
+        plan = _dumps({"mode": self.gravity.mode,
+                       "dropMs": self.gravity.drop_ms})
+        self._snap_prefix = [
+            b'{"type":"SNAPSHOT","userId":%s,"gravityPlan":%s'
+            % (_dumps(u), plan) for u in self.users]
+        # 每個 side 上次送出的 (欄位, 棋盤)，用來算差異快照
+        self._last_sent: List[Optional[Tuple]] = [None] * len(users)
 
     def apply_input(self, side: int, action: str):
         if side >= len(self.engines):
@@ -128,12 +234,15 @@ class GameRoom:
             eng.hold()
 
     def tick_drop(self, now_ms: int):
+        scores, lines_total = self.scores, self.lines_total
         for i, eng in enumerate(self.engines):
             if eng.top_out:
                 continue
             cleared, score_delta = eng.gravity_step()
-            self.scores[i] += score_delta
-            self.lines_total[i] += cleared
+            # 沒有落地 (大部分 tick) 時不必更新分數
+            if score_delta or cleared:
+                scores[i] += score_delta
+                lines_total[i] += cleared
 
     def check_game_over(self, now: float):
         if self.mode == "survival":
@@ -174,54 +283,108 @@ class GameRoom:
                 self.winner = f"P{w_idx+1}" if w_idx != -1 else "draw"
                 self.reason = "Time's up"
 
-    def build_snapshot(self, side: int, now_ms: int) -> dict:
-        me = self.engines[side]
-        snap_me = me.snapshot()
-
-        opponents = []
+    def opponent_views(self) -> List[bytes]:
+        """每個 side 給對手看的資料 (已編碼的 JSON 物件)；
+        每次廣播只建一次，所有收件者共用"""
+        views = []
         for i, eng in enumerate(self.engines):
-            if i == side:
-                continue
-            snap_opp = eng.snapshot(minified=False)
-            opponents.append({
+            snap = eng.snapshot(minified=False)
+            views.append(_dumps({
                 "userId": self.users[i],
                 "side": i,
                 "score": self.scores[i],
                 "lines": self.lines_total[i],
-                "boardRLE": rle_encode_board(snap_opp.board),
-                "board": snap_opp.board,
-                "active": snap_opp.active,
+                "active": snap.active,
                 "alive": not eng.top_out
-            })
-
-        return {
-            "type": "SNAPSHOT",
-            "tick": now_ms,
-            "userId": self.users[side],
-            "score": self.scores[side],
-            "lines": self.lines_total[side],
-            "level": self.levels[side],
-            "active": snap_me.active,
-            "hold": snap_me.hold,
-            "next": snap_me.next3,
-            "boardRLE": rle_encode_board(snap_me.board),
-            "board": snap_me.board,
-            "opponents": opponents,
-            "gravityPlan": {"mode": self.gravity.mode, "dropMs": self.gravity.drop_ms},
-            "at": now_ms,
-        }
+            }))
+        return views
+
+    def build_snapshot(self, side: int, now_ms: int,
+                       views: Optional[List[bytes]] = None,
+                       keyframe: bool = True) -> List[bytes]:
+        """回傳 SNAPSHOT frame 的各段 (格式見 _SNAP_TAG / _DELTA_TAG)；
+        keyframe=False 時只放上次送給這個 side 之後有變的欄位與棋盤"""
+        # views: 這次廣播先算好的 opponent_views()，沒給就現算
+        if views is None:
+            views = self.opponent_views()
+        me = self.engines[side]
+        snap_me = me.snapshot()
+        others = [i for i in range(len(self.engines)) if i != side]
+
+        # 每個欄位各自編碼成 (名稱, JSON)；數字直接用 %d 格式化
+        fields = (
+            (b"score", b"%d" % self.scores[side]),
+            (b"lines", b"%d" % self.lines_total[side]),
+            (b"level", b"%d" % self.levels[side]),
+            (b"active", _dumps(snap_me.active)),
+            (b"hold", _dumps(snap_me.hold)),
+            (b"next", _dumps(snap_me.next3)),
+            (b"opponents", b"[%s]" % b",".join([views[i] for i in others])),
+        )
+        # 棋盤沒變時 packed_board 直接回傳快取
+        boards = [me.packed_board()] + [
+            self.engines[i].packed_board() for i in others]
+        last = self._last_sent[side]
+        self._last_sent[side] = (fields, boards)
+        stamp = b',"tick":%d,"at":%d' % (now_ms, now_ms)
+
+        if keyframe or last is None or len(boards) > _DELTA_MAX_BOARDS:
+            # 完整快照：固定前綴 + 所有欄位
+            meta = b"".join([self._snap_prefix[side], stamp] +
+                            [b',"%s":%s' % f for f in fields] + [b"}"])
+            return pack_snapshot(meta, boards)
+
+        last_fields, last_boards = last
+        meta = b"".join([b'{"type":"SNAPSHOT"', stamp] +
+                        [b',"%s":%s' % f for f, old in zip(fields, last_fields)
+                         if f[1] != old[1]] + [b"}"])
+        mask = 0
+        changed = []
+        for i, (b, old) in enumerate(zip(boards, last_boards)):
+            if b != old:  # 沒變時是同一個快取物件，比較幾乎不花時間
+                mask |= 1 << i
+                changed.append(b)
+        return pack_delta(meta, mask, changed)
+
+
+def _close_listener(sock):
+    # Linux 上只 close 不會叫醒另一條執行緒裡阻塞中的 accept，要先 shutdown
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+_SOCK_BUF = 256 * 1024
+
+
+def _tune_socket(conn):
+    # INPUT / SNAPSHOT 都是小封包，關掉 Nagle 才不會被延遲約 40ms；
+    # 加大 buffer，廣播快照時 sendall 不容易卡住
+    try:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SOCK_BUF)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _SOCK_BUF)
+        if hasattr(socket, "TCP_QUICKACK"):  # 只有 Linux 有
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    except OSError:
+        pass
 
 
 def accept_thread(server_sock, expect_users, join_queue, stop_flag):
     server_sock.listen(8)
+    # 直接阻塞在 accept，不再每 0.5 秒醒來檢查 stop_flag；
+    # 結束時由 _close_listener 關掉 socket，accept 丟 OSError 跳出迴圈
     while not stop_flag.is_set():
         try:
-            server_sock.settimeout(0.5)
             conn, addr = server_sock.accept()
-        except socket.timeout:
-            continue
         except:
             break
+        _tune_socket(conn)
 
         def handle_hello(c, a):
             try:
@@ -300,6 +463,8 @@ def main():
         timed_seconds=args.timed_seconds, target_lines=args.target_lines, seed=seed
     )
 
+    # 單一 listening socket，不開 SO_REUSEPORT：port 已被別的房間佔用時
+    # bind 要直接失敗，不能讓兩個房間默默分掉彼此的連線
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     srv.bind((args.host, args.port))
@@ -309,7 +474,9 @@ def main():
     )
 
     stop_flag = threading.Event()
-    join_queue: List[Tuple] = []
+    # accept 執行緒 append、主迴圈 popleft，deque 兩端操作都是 O(1)
+    join_queue: Deque[Tuple] = deque()
+    # HELLO 由各自的執行緒處理，一條 accept 執行緒就夠了
     th = threading.Thread(target=accept_thread, args=(
         srv, users, join_queue, stop_flag), daemon=True)
     th.start()
@@ -331,7 +498,7 @@ def main():
             break
 
         while join_queue:
-            conn, addr, uid, role = join_queue.pop(0)
+            conn, addr, uid, role = join_queue.popleft()
             try:
                 if role == "player":
                     if uid in players:
@@ -383,6 +550,7 @@ def main():
     if not actual_users:
         print("[GameServer] No players connected. Shutting down.")
         stop_flag.set()
+        _close_listener(srv)
         return
 
     # 如果人數變少了，我們必須重新建立 GameRoom
@@ -407,79 +575,104 @@ def main():
     # 倒數
     print("[GameServer] Starting countdown...")
     for i in range(3, 0, -1):  # 改成 3 秒比較快
-        for c in conns + spectators:
-            try:
-                send_message(c.sock, {"type": "COUNTDOWN", "seconds": i})
-            except Exception:
-                pass
+        broadcast(conns + spectators, {"type": "COUNTDOWN", "seconds": i})
         time.sleep(1.0)
 
-    for c in conns + spectators:
-        try:
-            send_message(c.sock, {"type": "START"})
-        except Exception:
-            pass
-
-    last_drop = time.time() * 1000.0
-    last_broadcast = 0.0
-    SNAPSHOT_INTERVAL_MS = 60.0
+    broadcast(conns + spectators, {"type": "START"})
 
     for i in range(len(users)):
         room.engines[i].spawn_if_needed()
 
+    # 每個連線只註冊一次 (Linux 上是 epoll)，不必每輪重建 select 的 fd 清單；
+    # data 是玩家的 side，觀戰者為 None
+    sel = selectors.DefaultSelector()
+    for idx, pc in enumerate(conns):
+        if pc.alive:
+            sel.register(pc.sock, selectors.EVENT_READ, idx)
+    for sp in spectators:
+        if sp.alive:
+            sel.register(sp.sock, selectors.EVENT_READ, None)
+
+    # 主迴圈每秒跑上百次：常用的屬性 / 全域名稱先綁成區域變數
+    clock = time.time
+    wait = sel.select
+    engines = room.engines
+    apply_input = room.apply_input
+
+    # 固定步長：時間切成 BASE_TICK_MS 的 tick，重力每 drop_ticks 個 tick
+    # 一次、快照每 SNAPSHOT_TICKS 個 tick 一次，都以開局時間為基準計算，
+    # 不會因為每輪的誤差累積而漂移
+    drop_ticks = max(1, round(room.drop_ms / BASE_TICK_MS))
+    start_ms = clock() * 1000
+    last_tick = -1
+    n_snapshots = 0
+
     while not room.over:
-        now = time.time()
+        # 等到有封包進來，或下一個 tick 的時間到 (輸入一到就能處理)
+        next_ms = start_ms + (last_tick + 1) * BASE_TICK_MS
+        timeout = max(0.0, (next_ms - clock() * 1000) / 1000.0)
+        try:
+            events = wait(timeout=timeout)
+        except Exception:
+            # 例如 Windows 上沒有任何 socket 可等時 select 會報錯
+            events = []
+            time.sleep(timeout)
+        now = clock()
         now_ms = int(now * 1000)
 
         # Handle Inputs
-        rlist = [c.sock for c in conns if c.alive] + \
-            [s.sock for s in spectators if s.alive]
-        if rlist:
+        for key, _ in events:
+            rs = key.fileobj
             try:
-                rl, _, _ = select.select(rlist, [], [], 0.0)
+                msg = recv_message(rs)
+                t = msg.get("type")
+                if t == "INPUT":
+                    uid = int(msg.get("userId"))
+                    act = msg.get("action")
+                    if uid in side_of:
+                        apply_input(side_of[uid], act)
+                elif t == "PLUGIN" or t == "CHAT":
+                    broadcast(conns + spectators, msg)
             except Exception:
-                rl = []
-            for rs in rl:
-                try:
-                    msg = recv_message(rs)
-                    t = msg.get("type")
-                    if t == "INPUT":
-                        uid = int(msg.get("userId"))
-                        act = msg.get("action")
-                        if uid in side_of:
-                            room.apply_input(side_of[uid], act)
-                    elif t == "PLUGIN" or t == "CHAT":
-                        for c in conns + spectators:
-                            if c.alive:
-                                try:
-                                    send_message(c.sock, msg)
-                                except:
-                                    pass
-                except Exception:
-                    for idx, pc in enumerate(conns):
-                        if pc.sock is rs:
-                            pc.close()
-                            # 斷線視為輸掉
-                            room.engines[idx].top_out = True
-
-        # Gravity
-        if now_ms - last_drop >= room.drop_ms:
+                sel.unregister(rs)
+                if key.data is None:
+                    for sp in spectators:
+                        if sp.sock is rs:
+                            sp.close()
+                else:
+                    conns[key.data].close()
+                    # 斷線視為輸掉
+                    engines[key.data].top_out = True
+
+        tick = int((now_ms - start_ms) // BASE_TICK_MS)
+        if tick == last_tick:
+            room.check_game_over(now)
+            continue
+
+        # Gravity：落後好幾個 tick 時 (機器忙) 補跑漏掉的下落
+        for _ in range(tick // drop_ticks - max(last_tick, 0) // drop_ticks):
             room.tick_drop(now_ms)
-            last_drop = now_ms
-
-        # Snapshot
-        if now_ms - last_broadcast >= SNAPSHOT_INTERVAL_MS:
-            for idx, pc in enumerate(conns):
-                if pc.alive:
-                    snap = room.build_snapshot(idx, now_ms)
-                    try:
-                        send_message(pc.sock, snap)
-                    except Exception:
-                        pass
-            last_broadcast = now_ms
 
+        # Snapshot：同一輪跨過好幾個廣播點也只送一次最新的
+        if tick // SNAPSHOT_TICKS != last_tick // SNAPSHOT_TICKS:
+            views = room.opponent_views()
+            alive = [(idx, pc) for idx, pc in enumerate(conns) if pc.alive]
+            keyframe = n_snapshots % KEYFRAME_SNAPSHOTS == 0
+            n_snapshots += 1
+            snaps = [room.build_snapshot(idx, now_ms, views, keyframe)
+                     for idx, _ in alive]
+            for (idx, pc), snap in zip(alive, snaps):
+                try:
+                    send_parts(pc.sock, snap)
+                except OSError:
+                    # 送不出去就當作斷線 (同讀取失敗)，視為輸掉
+                    sel.unregister(pc.sock)
+                    pc.close()
+                    engines[idx].top_out = True
+
+        last_tick = tick
         room.check_game_over(now)
-        time.sleep(0.005)
+    sel.close()
 
     # Result
     scores_dict = {f"P{i+1}": s for i, s in enumerate(room.scores)}
@@ -490,20 +683,12 @@ def main():
         "score": scores_dict
     }
 
-    for pc in conns + spectators:
-        if pc.alive:
-            try:
-                send_message(pc.sock, result)
-            except Exception:
-                pass
+    broadcast(conns + spectators, result)
 
     report_to_lobby(result)
     time.sleep(2.0)
     stop_flag.set()
-    try:
-        srv.close()
-    except Exception:
-        pass
+    _close_listener(srv)
     print(f"[GameServer] Game Over. Winner: {room.winner}")
 
 
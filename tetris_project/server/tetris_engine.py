@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 from dataclasses import dataclass
+from itertools import chain, groupby
 import random
 from typing import Callable, List, Optional, Tuple
 
 W, H = 10, 20
+_HI_NYBBLE = bytes((v << 4) & 0xFF for v in range(256))  # v -> v << 4
 
 # 7-bag 定義（形狀代碼與顏色索引，顏色交由 client 決定也OK）
 SHAPES = {
@@ -51,6 +53,7 @@ SHAPES = {
     ],
 }
 ORDER = ["I", "O", "T", "S", "Z", "J", "L"]
+COLOR = {shape: 1 + i for i, shape in enumerate(ORDER)}  # 1..7
 
 
 @dataclass
@@ -85,6 +88,13 @@ def make_bag_rng(seed: int) -> Callable[[], Callable[[], str]]:
 
 
 class TetrisEngine:
+    # 固定欄位：屬性存在物件內的陣列裡 (沒有 __dict__)，
+    # 每 tick 反覆讀寫的 x / y / board 存取較快，物件也較小
+    __slots__ = ("board", "bag_next", "queue", "hold_slot", "hold_used",
+                 "cur_shape", "rot", "x", "y", "top_out",
+                 "_board_ver", "_rle_ver", "_rle_cache",
+                 "_packed_ver", "_packed_cache")
+
     def __init__(self, bag_rng: Callable[[], str]):
         self.board = [[0]*W for _ in range(H)]  # 0=empty, >0=color id
         self.bag_next = bag_rng
@@ -98,6 +108,14 @@ class TetrisEngine:
         self.y = 0
         self.top_out = False
 
+        # board 只在 lock_piece 時改變：以版本號快取 RLE，
+        # 每次廣播不必重新掃描 200 格
+        self._board_ver = 0
+        self._rle_ver = -1
+        self._rle_cache = ""
+        self._packed_ver = -1
+        self._packed_cache = b""
+
     # ---------- utilities ----------
     def spawn_if_needed(self):
         if self.cur_shape is None:
@@ -119,19 +137,34 @@ class TetrisEngine:
                 return True
         return False
 
+    def drop_distance(self) -> int:
+        """目前方塊還能往下掉幾格。每個方塊格各自往下找第一個擋住的格子
+        取最小值，不必每往下一格就重跑一次 collide"""
+        board = self.board
+        dist = H
+        for (dx, dy) in self.shape_cells(self.cur_shape, self.rot):
+            xx, yy = self.x + dx, self.y + dy + 1
+            d = 0
+            while d < dist and yy < H and not board[yy][xx]:
+                yy += 1
+                d += 1
+            dist = d
+        return dist
+
     def lock_piece(self):
         # 將 active 方塊寫入 board
-        color = 1 + ORDER.index(self.cur_shape)  # 1..7
+        color = COLOR[self.cur_shape]
         for (dx, dy) in self.shape_cells(self.cur_shape, self.rot):
             xx, yy = self.x + dx, self.y + dy
             if 0 <= xx < W and 0 <= yy < H:
                 self.board[yy][xx] = color
         # 清行
         lines = 0
-        new_rows = [row for row in self.board if any(v == 0 for v in row)]
+        new_rows = [row for row in self.board if 0 in row]
         lines = H - len(new_rows)
         if lines:
             self.board = [[0]*W for _ in range(lines)] + new_rows
+        self._board_ver += 1
         # 下一顆
         self.cur_shape = None
         self.hold_used = False
@@ -172,10 +205,8 @@ class TetrisEngine:
     def hard_drop(self):
         if self.top_out or self.cur_shape is None:
             return (0, 0)
-        dist = 0
-        while not self.collide(self.x, self.y + 1, self.cur_shape, self.rot):
-            self.y += 1
-            dist += 1
+        dist = self.drop_distance()
+        self.y += dist
         # 硬降額外分數（每格 2 分）
         lines, base = self.lock_piece()
         return lines, base + dist * 2
@@ -219,6 +250,26 @@ class TetrisEngine:
             hold=self.hold_slot
         )
 
+    def rle_board(self) -> str:
+        """目前 board 的 RLE 字串 (board 沒變就直接回傳上次的結果)"""
+        if self._rle_ver != self._board_ver:
+            self._rle_cache = rle_encode_board(self.board)
+            self._rle_ver = self._board_ver
+        return self._rle_cache
+
+    def packed_board(self) -> bytes:
+        """board 逐列攤平後每兩格擠成 1 byte (顏色 id 0..8 只需 4 bits)，
+        共 W*H/2 = 100 bytes，SNAPSHOT 用"""
+        if self._packed_ver != self._board_ver:
+            # 偶數格 (translate 成高 4 bits) 與奇數格各自轉成一個大整數再 OR，
+            # 整段在 C 裡完成，不必在 Python 迴圈裡逐格處理
+            flat = bytes(chain.from_iterable(self.board))
+            hi = int.from_bytes(flat[0::2].translate(_HI_NYBBLE), "big")
+            lo = int.from_bytes(flat[1::2], "big")
+            self._packed_cache = (hi | lo).to_bytes(len(flat) // 2, "big")
+            self._packed_ver = self._board_ver
+        return self._packed_cache
+
     @staticmethod
     def minify_board(board: List[List[int]]) -> List[List[int]]:
         # 觀戰縮圖可用：抽稀取樣（2x2 -> 1）
@@ -237,17 +288,7 @@ class TetrisEngine:
 
 def rle_encode_board(board: List[List[int]]) -> str:
     """簡單 RLE：逐行壓縮，e.g. '5x0,3x2,1x0|10x0|...' """
-    rows = []
-    for row in board:
-        out = []
-        last = row[0]
-        cnt = 1
-        for v in row[1:]:
-            if v == last:
-                cnt += 1
-            else:
-                out.append(f"{cnt}x{last}")
-                last, cnt = v, 1
-        out.append(f"{cnt}x{last}")
-        rows.append(",".join(out))
-    return "|".join(rows)
+    # groupby 在 C 裡切出連續相同的格子，只剩每個 run 一次 Python 運算
+    return "|".join(
+        ",".join([f"{sum(1 for _ in g)}x{v}" for v, g in groupby(row)])
+        for row in board)